@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark decoding the full control area (registers 0 - 180)
+
+Compares the original scan + getattr decode path with the
+prebuilt lookup tables in chamber_commands.
+No chamber is needed, values are synthesized.
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import timeit
+
+import chamber_commands
+
+
+def legacy_reg_value_to_name(search_reg):
+    """Original linear scan of ctrl_registers"""
+    for name, reg in chamber_commands.ctrl_registers.iteritems():
+        if reg == search_reg:
+            return name
+
+
+def legacy_decode_read_value(reg, value):
+    """Original decode: scan for the name, then getattr on a formatted string"""
+    reg_name = legacy_reg_value_to_name(reg)
+
+    if not reg_name:
+        return "UNDEFINED", "NO MATCH"
+
+    try:
+        operation = getattr(chamber_commands.this_module, reg_name.lower())
+    except AttributeError:
+        return reg_name, "Non Readable Register"
+
+    if not callable(operation):
+        return reg_name, "NO MATCH"
+
+    return operation(value)
+
+
+def decode_block_legacy(start_reg, values):
+    return [
+        legacy_decode_read_value(reg, value)
+        for reg, value in enumerate(values, start_reg)
+    ]
+
+
+def decode_block_tables(start_reg, values):
+    return [
+        chamber_commands.decode_read_value(reg, value)
+        for reg, value in enumerate(values, start_reg)
+    ]
+
+
+def main():
+    start_reg = 0
+    quantity = 181
+    # Stay within printable ascii so the profile name registers decode
+    values = [0x4141 + reg for reg in range(quantity)]
+
+    assert decode_block_legacy(start_reg, values) == \
+        decode_block_tables(start_reg, values)
+
+    repeat = 200
+    legacy = min(timeit.repeat(
+        lambda: decode_block_legacy(start_reg, values), number=repeat, repeat=5
+    ))
+    tables = min(timeit.repeat(
+        lambda: decode_block_tables(start_reg, values), number=repeat, repeat=5
+    ))
+
+    print("Decode registers {}-{}, {} passes".format(start_reg, quantity - 1, repeat))
+    print("{:<20}{:>10.1f} us/block".format("legacy scan", legacy / repeat * 1e6))
+    print("{:<20}{:>10.1f} us/block".format("lookup tables", tables / repeat * 1e6))
+    print("{:<20}{:>10.1f} x".format("speedup", legacy / tables))
+
+
+if __name__ == '__main__':
+    main()
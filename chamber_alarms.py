@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Watch the 5 alarm registers (55-59) and report only changes
+
+One read covers all five registers. The previous masks are kept, so an
+event is only emitted when a bit is raised or cleared.
+
+    watcher = chamber_alarms.AlarmWatcher(chamber)
+    watcher.subscribe(lambda event: log.warning(event))
+    watcher.start(interval=1.0)
+    event = watcher.wait_for_alarm(timeout=60)
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import collections
+import threading
+import time
+
+import chamber_commands
+import chamber_state
+
+
+def _remaining(deadline):
+    """Seconds left until deadline, None for no deadline"""
+    if deadline is None:
+        return None
+    return max(0, deadline - time.time())
+
+
+class AlarmEvent(object):
+    """A single alarm bit that was raised or cleared"""
+    __slots__ = ('group', 'name', 'raised', 'timestamp', 'raised_at')
+
+    def __init__(self, group, name, raised, timestamp, raised_at):
+        """
+        :param group: AlarmsView field, e.g. 'chamber'
+        :param name: flag name, e.g. 'Door Open'
+        :param raised: True when the alarm came on, False when it cleared
+        :param timestamp: time.time() of the read that saw the change
+        :param raised_at: time.time() the alarm was first seen on
+        """
+        self.group = group
+        self.name = name
+        self.raised = raised
+        self.timestamp = timestamp
+        self.raised_at = raised_at
+
+    @property
+    def duration(self):
+        """Seconds the alarm was on, for cleared events"""
+        return self.timestamp - self.raised_at
+
+    def __repr__(self):
+        return "AlarmEvent({}:{} {} at {:.3f})".format(
+            self.group,
+            self.name,
+            'raised' if self.raised else 'cleared',
+            self.timestamp
+        )
+
+
+class AlarmWatcher(object):
+    """Keep the last alarm masks, emit AlarmEvents for the bits that change"""
+
+    def __init__(self, chamber, log=None, history=1000):
+        """
+        :param chamber: chamber_control.Chamber
+        :param log: logger, default chamber.log
+        :param history: number of recent events kept in self.events
+        """
+        self.chamber = chamber
+        self.log = log if log is not None else chamber.log
+        self.masks = None
+        self.timestamp = None
+        self.events = collections.deque(maxlen=history)
+        # count of every event ever emitted, events only keeps the last few
+        self._sequence = 0
+        # (group, name) => time the alarm was raised
+        self.active = {}
+        self._flags = tuple(
+            chamber_commands.ctrl_register_bitflags[chamber_state.ALARM_START + offset]
+            for offset in range(chamber_state.ALARM_QUANTITY)
+        )
+        self._callbacks = []
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback):
+        """callback(event) for every AlarmEvent, called from the polling thread"""
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback):
+        self._callbacks.remove(callback)
+
+    def read_masks(self):
+        """EZT570I_ALARM_STATUS ... SYSTEM_STATUS_MONITOR in one read"""
+        values = self.chamber.ccomm.read_registers(
+            chamber_state.ALARM_START, chamber_state.ALARM_QUANTITY
+        )
+        return tuple(values.data)
+
+    def poll(self):
+        """Read the alarm registers once
+        :return: list of AlarmEvent, empty when nothing changed
+        """
+        return self.update(self.read_masks(), time.time())
+
+    def update(self, masks, timestamp=None):
+        """Feed masks read elsewhere, e.g. Snapshot.alarms.masks()
+        :return: list of AlarmEvent, empty when nothing changed
+        """
+        timestamp = timestamp if timestamp is not None else time.time()
+        previous = self.masks or (0,) * chamber_state.ALARM_QUANTITY
+        events = []
+        for group, flags, old_mask, new_mask in zip(
+                chamber_state.AlarmsView.fields, self._flags, previous, masks):
+            if old_mask == new_mask:
+                continue
+            raised, cleared = flags.changed(old_mask, new_mask)
+            for name in raised:
+                self.active[(group, name)] = timestamp
+                events.append(AlarmEvent(group, name, True, timestamp, timestamp))
+            for name in cleared:
+                raised_at = self.active.pop((group, name), timestamp)
+                events.append(AlarmEvent(group, name, False, timestamp, raised_at))
+
+        with self._condition:
+            self.masks = tuple(masks)
+            self.timestamp = timestamp
+            self.events.extend(events)
+            self._sequence += len(events)
+            if events:
+                self._condition.notify_all()
+
+        for event in events:
+            self.log.info("Alarm:{}".format(event))
+            for callback in list(self._callbacks):
+                callback(event)
+        return events
+
+    @property
+    def polling(self):
+        """True while start() has a polling thread running"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def wait_for_alarm(self, timeout=None, interval=1.0):
+        """Block until an alarm is raised
+        Polls the chamber itself unless start() is running a polling thread.
+        :param timeout: seconds, None waits forever
+        :param interval: seconds between polls when polling here
+        :return: first raised AlarmEvent, None on timeout
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            seen = self._sequence
+        while True:
+            if self.polling:
+                with self._condition:
+                    if self._sequence == seen:
+                        self._condition.wait(_remaining(deadline))
+                    new_events = list(self.events)[-(self._sequence - seen):] \
+                        if self._sequence != seen else []
+                    seen = self._sequence
+            else:
+                new_events = self.poll()
+
+            for event in new_events:
+                if event.raised:
+                    return event
+
+            remaining = _remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                return None
+            if not self.polling:
+                time.sleep(interval if remaining is None else min(interval, remaining))
+
+    def start(self, interval=1.0):
+        """Poll in a background thread, events go to the subscribed callbacks
+        Each read holds ChamberCommunication.bus_lock, so the main thread can
+        keep using the same connection.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.log.error("Alarm poll failed:{}".format(e))
+            self._stop.wait(interval)
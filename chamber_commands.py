@@ -9,8 +9,17 @@ this is distributed under a MIT license, see LICENSE
 """
 
 import sys
+import array
 import struct
 import ctypes
+import operator
+import threading
+import collections
+
+try:
+    import numpy  # optional, used for bulk decode when the caller has ndarrays
+except ImportError:
+    numpy = None
 
 this_module = sys.modules[__name__]
 
@@ -354,70 +363,187 @@ def encode_set_value(reg_name, value):
     :param value: Human understandable value
     :return: 1) EZT570i register, 2) value to write
     """
-    reg = name_to_reg(reg_name)
-    if not reg:
+    reg = ctrl_registers.get(reg_name)
+    if reg is None:
         return None, None
 
-    setter = "set_{}".format(reg_name.lower())
-
-    try:
-        operation = getattr(this_module, setter)
-    except AttributeError:
+    operation = ctrl_register_encoders.get(reg_name)
+    if operation is None:
         return reg_name, "Non Writeable Register"
 
-    if not callable(operation):
-        return reg_name, "NO MATCH"
-
     return reg, operation(value)
 
 
 def decode_read_value(reg, value):
     """
-    For getting values, run method that matches the register name"""
-    reg_name = reg_value_to_name(reg)
-
-    if not reg_name:
+    For getting values, run method that matches the register name.
+    Uses the prebuilt ctrl_register_decoders table, no scans or getattr"""
+    if not 0 <= reg < ctrl_register_count:
         return "UNDEFINED", "NO MATCH"
 
-    try:
-        operation = getattr(this_module, reg_name.lower())
-    except AttributeError:
+    operation = ctrl_register_decoders[reg]
+    if operation is None:
+        reg_name = ctrl_register_names[reg]
+        if reg_name is None:
+            return "UNDEFINED", "NO MATCH"
         return reg_name, "Non Readable Register"
 
-    if not callable(operation):
-        return reg_name, "NO MATCH"
-
     return operation(value)
 
 
+# bitfield_byte_table[b] is the 8 bits of byte b, least significant first
+bitfield_byte_table = tuple(
+    tuple((byte >> bit) & 1 for bit in range(8)) for byte in range(256)
+)
+
+
 def bitfield(raw):
-    """Convert int to array of bits"""
-    bits_fields = BitFields(raw)
-    response = [
-        bits_fields.bit1,
-        bits_fields.bit2,
-        bits_fields.bit3,
-        bits_fields.bit4,
-        bits_fields.bit5,
-        bits_fields.bit6,
-        bits_fields.bit7,
-        bits_fields.bit8,
-        bits_fields.bit9,
-        bits_fields.bit10,
-        bits_fields.bit11,
-        bits_fields.bit12,
-        bits_fields.bit13,
-        bits_fields.bit14,
-        bits_fields.bit15,
-        bits_fields.bit16
-    ]
-    return response
+    """Convert int to array of bits, bitfield(raw)[n] is Bit n of the register"""
+    raw &= 0xFFFF
+    return list(bitfield_byte_table[raw & 0xFF] + bitfield_byte_table[raw >> 8])
+
+
+def _byte_tables(names, entry, only_set=False):
+    """For both bytes of a 16 bit register build 256 entry tables.
+    Entry n of a table is the tuple of entry(name, bit) over the named bits of byte n,
+    or only over the bits that are on when only_set is True.
+    """
+    tables = []
+    for byte_names in (names[:8], names[8:]):
+        table = []
+        for byte in range(256):
+            table.append(tuple(
+                entry(name, (byte >> bit) & 1)
+                for bit, name in enumerate(byte_names)
+                if name is not None and ((byte >> bit) & 1 or not only_set)
+            ))
+        tables.append(tuple(table))
+    return tables
+
+
+class BitFlags(object):
+    """Precomputed decode for a bit oriented register.
+    names[n] is the flag carried by Bit n (Bit0 is the least significant bit),
+    None where the manual leaves the bit unused.
+    Every decode is two 256 entry table lookups, one per byte, no per bit work.
+    """
+    __slots__ = (
+        'names', 'keys', 'states', 'bits',
+        '_active_low', '_active_high', '_states_low', '_states_high'
+    )
+
+    def __init__(self, names, states=None):
+        self.names = tuple(names) + (None,) * (16 - len(names))
+        self.keys = tuple(name for name in self.names if name is not None)
+        self.states = states if states is not None else state_alarm
+        # name => bit mask
+        self.bits = dict(
+            (name, 1 << bit) for bit, name in enumerate(self.names) if name is not None
+        )
+        self._active_low, self._active_high = _byte_tables(
+            self.names, lambda name, bit: name, only_set=True
+        )
+        self._states_low, self._states_high = _byte_tables(
+            self.names, lambda name, bit: self.states[bit]
+        )
+
+    def active(self, mask):
+        """Immutable tuple of the names of the bits that are on"""
+        mask &= 0xFFFF
+        return self._active_low[mask & 0xFF] + self._active_high[mask >> 8]
+
+    def changed(self, old_mask, new_mask):
+        """Which flags changed between two reads
+        :return: (raised, cleared) tuples of names
+        """
+        old_mask &= 0xFFFF
+        new_mask &= 0xFFFF
+        return (
+            self.active(new_mask & ~old_mask),
+            self.active(old_mask & ~new_mask)
+        )
+
+    def as_dict(self, mask):
+        """Every named flag mapped to its state string, e.g. 'normal'/'Alarm'"""
+        mask &= 0xFFFF
+        return dict(zip(
+            self.keys,
+            self._states_low[mask & 0xFF] + self._states_high[mask >> 8]
+        ))
+
+    def view(self, mask):
+        """Raw mask with lazy access by flag name"""
+        return BitView(self, mask)
+
+    def encode(self, states):
+        """Mask for writing the register
+        :param states: int mask, iterable of names that are on, or dict of
+            name => True/False or state string, as as_dict returns
+        """
+        if isinstance(states, (int, long)):
+            return states & 0xFFFF
+        if isinstance(states, dict):
+            states = [
+                name for name, state in states.iteritems()
+                if state is True or state in ('on', self.states[1])
+            ]
+        mask = 0
+        for name in states:
+            mask |= self.bits[name]
+        return mask
+
+
+class BitView(object):
+    """A register mask, decoded by name only when asked"""
+    __slots__ = ('flags', 'mask')
+
+    def __init__(self, flags, mask):
+        self.flags = flags
+        self.mask = mask & 0xFFFF
+
+    def __getitem__(self, name):
+        return bool(self.mask & self.flags.bits[name])
+
+    def __contains__(self, name):
+        return name in self.flags.bits
+
+    def __iter__(self):
+        return iter(self.flags.active(self.mask))
+
+    def __nonzero__(self):
+        return bool(self.active)
+
+    __bool__ = __nonzero__
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, BitView) and
+            self.flags is other.flags and
+            self.mask == other.mask
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.flags), self.mask))
+
+    @property
+    def active(self):
+        return self.flags.active(self.mask)
+
+    def changed(self, previous):
+        """(raised, cleared) names relative to an earlier BitView or mask"""
+        previous_mask = previous.mask if isinstance(previous, BitView) else previous
+        return self.flags.changed(previous_mask, self.mask)
+
+    def __repr__(self):
+        return "BitView(0x{:04X}, {})".format(self.mask, self.active)
 
 
 def reg_value_to_name(search_reg):
-    for name, reg in ctrl_registers.iteritems():
-        if reg == search_reg:
-            return name
+    if 0 <= search_reg < ctrl_register_count:
+        return ctrl_register_names[search_reg]
 
 
 def name_to_reg(search_name):
@@ -470,8 +596,8 @@ def get_signed_int_tens_decimal(value):
     """
      -32768 – 32767 (-3276.8 – 3276.7)
      """
-    response = value / 10
-    return {'degrees': float(response)}
+    response = value / 10.0
+    return {'degrees': response}
 
 
 def set_signed_int_tens_decimal(value):
@@ -483,26 +609,27 @@ def set_signed_int_tens_decimal(value):
     return response
 
 
+flags_event_control = BitFlags((
+    'Event 1',
+    'Event2',
+    'Event 3',
+    'Event 4',
+    'Event 5',
+    'Event 6',
+    'Event 7',
+    'Event 8',
+    'Event 9',
+    'Event 10',
+    'Event 11',
+    'Event 12',
+    'Event 13',
+    'Event 14',
+    'Event 15',
+))
+
+
 def get_event_control(value):
-    bit_array = bitfield(value)
-    response = {
-        'Event 1': state_alarm[bit_array[0]],
-        'Event2': state_alarm[bit_array[1]],
-        'Event 3': state_alarm[bit_array[2]],
-        'Event 4': state_alarm[bit_array[3]],
-        'Event 5': state_alarm[bit_array[4]],
-        'Event 6': state_alarm[bit_array[5]],
-        'Event 7': state_alarm[bit_array[6]],
-        'Event 8': state_alarm[bit_array[7]],
-        'Event 9': state_alarm[bit_array[8]],
-        'Event 10': state_alarm[bit_array[9]],
-        'Event 11': state_alarm[bit_array[10]],
-        'Event 12': state_alarm[bit_array[11]],
-        'Event 13': state_alarm[bit_array[12]],
-        'Event 14': state_alarm[bit_array[13]],
-        'Event 15': state_alarm[bit_array[14]]
-    }
-    return response
+    return flags_event_control.as_dict(value)
 
 
 def get_loop_alarm_output_assignment(value):
@@ -561,7 +688,7 @@ def get_loop_percent_output(value):
     """
     -10000 – 10000 (-100.00 – 100.00)
     """
-    response = value / 100
+    response = value / 100.0
     return "%out:{}".format(response)
 
 
@@ -833,8 +960,7 @@ def chamber_manual_event_control(value):
 
 
 def set_chamber_manual_event_control(value):
-    # TODO
-    pass
+    return flags_event_control.encode(value)
 
 
 def customer_manual_event_control(value):
@@ -842,8 +968,7 @@ def customer_manual_event_control(value):
 
 
 def set_customer_manual_event_control(value):
-    # TODO
-    pass
+    return flags_event_control.encode(value)
 
 
 def profile_control_status(value):
@@ -1071,114 +1196,119 @@ def set_alarm_acknowledge(value):
     return "NO MATCH"
 
 
+flags_ezt570i_alarm_status = BitFlags((
+    'Input1 Sensor Break',
+    'Input2 Sensor Break',
+    'Input3 Sensor Break',
+    'Input4 Sensor Break',
+    'Input5 Sensor Break',
+    'Input6 Sensor Break',
+    'Input7 Sensor Break',
+    'Input8 Sensor Break',
+    'Input9 Sensor Break',
+    'Input10 Sensor Break',
+    'Input11 Sensor Break',
+    'Input12 Sensor Break',
+    'Input13 Sensor Break',
+    '(not assigned)',
+    'Loop Communications Failure',
+))
+
+
 def ezt570i_alarm_status(value):
-    bit_array = bitfield(value)
-    response = {
-        'Input1 Sensor Break': state_alarm[bit_array[0]],
-        'Input2 Sensor Break': state_alarm[bit_array[1]],
-        'Input3 Sensor Break': state_alarm[bit_array[2]],
-        'Input4 Sensor Break': state_alarm[bit_array[3]],
-        'Input5 Sensor Break': state_alarm[bit_array[4]],
-        'Input6 Sensor Break': state_alarm[bit_array[5]],
-        'Input7 Sensor Break': state_alarm[bit_array[6]],
-        'Input8 Sensor Break': state_alarm[bit_array[7]],
-        'Input9 Sensor Break': state_alarm[bit_array[8]],
-        'Input10 Sensor Break': state_alarm[bit_array[9]],
-        'Input11 Sensor Break': state_alarm[bit_array[10]],
-        'Input12 Sensor Break': state_alarm[bit_array[11]],
-        'Input13 Sensor Break': state_alarm[bit_array[12]],
-        '(not assigned)': state_alarm[bit_array[13]],
-        'Loop Communications Failure': state_alarm[bit_array[14]],
-    }
-    return response
+    return flags_ezt570i_alarm_status.as_dict(value)
+
+
+flags_input_alarm_status = BitFlags((
+    'Input1 Alarm',
+    'Input2 Alarm',
+    'Input3 Alarm',
+    'Input4 Alarm',
+    'Input5 Alarm',
+    'Input6 Alarm',
+    'Input7 Alarm',
+    'Input8 Alarm',
+    'Input9 Alarm',
+    'Input10 Alarm',
+    'Input11 Alarm',
+    'Input12 Alarm',
+    'Input13 Alarm',
+    '(not assigned 1)',
+    '(not assigned 2)',
+))
 
 
 def input_alarm_status(value):
-    bit_array = bitfield(value)
-    response = {
-        'Input1 Alarm': state_alarm[bit_array[0]],
-        'Input2 Alarm': state_alarm[bit_array[1]],
-        'Input3 Alarm': state_alarm[bit_array[2]],
-        'Input4 Alarm': state_alarm[bit_array[3]],
-        'Input5 Alarm': state_alarm[bit_array[4]],
-        'Input6 Alarm': state_alarm[bit_array[5]],
-        'Input7 Alarm': state_alarm[bit_array[6]],
-        'Input8 Alarm': state_alarm[bit_array[7]],
-        'Input9 Alarm': state_alarm[bit_array[8]],
-        'Input10 Alarm': state_alarm[bit_array[9]],
-        'Input11 Alarm': state_alarm[bit_array[10]],
-        'Input12 Alarm': state_alarm[bit_array[11]],
-        'Input13 Alarm': state_alarm[bit_array[12]],
-        '(not assigned 1)': state_alarm[bit_array[13]],
-        '(not assigned 2)': state_alarm[bit_array[14]]
-    }
-    return response
+    return flags_input_alarm_status.as_dict(value)
+
+
+flags_chamber_alarm_status = BitFlags((
+    'Heater High Limit (Plenum A)',
+    'External Product Safety',
+    'Boiler Over-Temp (Plenum A)',
+    'Boiler Low Water (Plenum A)',
+    'Dehumidifier System Fault (System B Boiler Over-Temp)',
+    'Motor Overload (Plenum A)',
+    'Fluid System High Limit (Plenum B Heater High Limit)',
+    'Fluid System High Pressure (Plenum B Motor Overload)',
+    'Fluid System Low Flow',
+    'Door Open',
+    '(System B Boiler Low Water)',
+    '(not assigned)',
+    'Emergency Stop',
+    'Power Failure',
+    'Transfer Error',
+))
 
 
 def chamber_alarm_status(value):
-    bit_array = bitfield(value)
-    response = {
-        'Heater High Limit (Plenum A)': state_alarm[bit_array[0]],
-        'External Product Safety': state_alarm[bit_array[1]],
-        'Boiler Over-Temp (Plenum A)': state_alarm[bit_array[2]],
-        'Boiler Low Water (Plenum A)': state_alarm[bit_array[3]],
-        'Dehumidifier System Fault (System B Boiler Over-Temp)': state_alarm[bit_array[4]],
-        'Motor Overload (Plenum A)': state_alarm[bit_array[5]],
-        'Fluid System High Limit (Plenum B Heater High Limit)': state_alarm[bit_array[6]],
-        'Fluid System High Pressure (Plenum B Motor Overload)': state_alarm[bit_array[7]],
-        'Fluid System Low Flow': state_alarm[bit_array[8]],
-        'Door Open': state_alarm[bit_array[9]],
-        '(System B Boiler Low Water)': state_alarm[bit_array[10]],
-        '(not assigned)': state_alarm[bit_array[11]],
-        'Emergency Stop': state_alarm[bit_array[12]],
-        'Power Failure': state_alarm[bit_array[13]],
-        'Transfer Error': state_alarm[bit_array[14]],
-    }
-    return response
+    return flags_chamber_alarm_status.as_dict(value)
+
+
+flags_refrigeration_alarm_status = BitFlags((
+    'System 1(A) High/Low Pressure',
+    'System 1(A) Low Oil Pressure',
+    'System 1(A) High Discharge Temperature',
+    'System 1(A) Compressor Protection Module',
+    'Pumpdown Disabled',
+    'System 1(A) Floodback Monitor',
+    '(not assigned) 1',
+    '(not assigned) 2',
+    'System 2(B) High/Low Pressure',
+    'System 2(B) Low Oil Pressure',
+    'System 2(B) High Discharge Temperature',
+    'System 2(B) Compressor Protection Module',
+    '(not assigned) 3',
+    'System B Floodback Monitor',
+    '(not assigned) 4',
+))
 
 
 def refrigeration_alarm_status(value):
-    bit_array = bitfield(value)
-    response = {
-        'System 1(A) High/Low Pressure': state_alarm[bit_array[0]],
-        'System 1(A) Low Oil Pressure': state_alarm[bit_array[1]],
-        'System 1(A) High Discharge Temperature': state_alarm[bit_array[2]],
-        'System 1(A) Compressor Protection Module': state_alarm[bit_array[3]],
-        'Pumpdown Disabled': state_alarm[bit_array[4]],
-        'System 1(A) Floodback Monitor': state_alarm[bit_array[5]],
-        '(not assigned) 1': state_alarm[bit_array[6]],
-        '(not assigned) 2': state_alarm[bit_array[7]],
-        'System 2(B) High/Low Pressure': state_alarm[bit_array[8]],
-        'System 2(B) Low Oil Pressure': state_alarm[bit_array[9]],
-        'System 2(B) High Discharge Temperature': state_alarm[bit_array[10]],
-        'System 2(B) Compressor Protection Module': state_alarm[bit_array[11]],
-        '(not assigned) 3': state_alarm[bit_array[12]],
-        'System B Floodback Monitor': state_alarm[bit_array[13]],
-        '(not assigned) 4': state_alarm[bit_array[14]],
-    }
-    return response
+    return flags_refrigeration_alarm_status.as_dict(value)
+
+
+flags_system_status_monitor = BitFlags((
+    'Humidity Water Reservoir Low',
+    'Humidity Disabled (temperature out-of-range)',
+    'Humidity High Dewpoint Limit',
+    'Humidity Low Dewpoint Limit',
+    'Door Open',
+    '(not assigned) 1',
+    '(not assigned) 2',
+    '(not assigned) 3',
+    'Service Air Circulators',
+    'Service Heating/Cooling System',
+    'Service Humidity System',
+    'Service Purge System',
+    'Service Altitude System',
+    'Service Transfer Mechanism',
+    '(not assigned) 4',
+))
 
 
 def system_status_monitor(value):
-    bit_array = bitfield(value)
-    response = {
-        'Humidity Water Reservoir Low': state_alarm[bit_array[0]],
-        'Humidity Disabled (temperature out-of-range)': state_alarm[bit_array[1]],
-        'Humidity High Dewpoint Limit': state_alarm[bit_array[2]],
-        'Humidity Low Dewpoint Limit': state_alarm[bit_array[3]],
-        'Door Open': state_alarm[bit_array[4]],
-        '(not assigned) 1': state_alarm[bit_array[5]],
-        '(not assigned) 2': state_alarm[bit_array[6]],
-        '(not assigned) 3': state_alarm[bit_array[7]],
-        'Service Air Circulators': state_alarm[bit_array[8]],
-        'Service Heating/Cooling System': state_alarm[bit_array[9]],
-        'Service Humidity System': state_alarm[bit_array[10]],
-        'Service Purge System': state_alarm[bit_array[11]],
-        'Service Altitude System': state_alarm[bit_array[12]],
-        'Service Transfer Mechanism': state_alarm[bit_array[13]],
-        '(not assigned) 4': state_alarm[bit_array[14]],
-    }
-    return response
+    return flags_system_status_monitor.as_dict(value)
 
 
 def loop_1_setpoint(value):
@@ -2110,24 +2240,25 @@ def get_autostart(value):
     return response
 
 
+flags_profile_step_guaranteed_soak_wait = BitFlags((
+    'Guaranteed Soak Loop 1',
+    'Guaranteed Soak Loop 2',
+    'Guaranteed Soak Loop 3',
+    'Guaranteed Soak Loop 4',
+    'Guaranteed Soak Loop 5',
+    'Digital Input 1 Wait For',
+    'Digital Input 2 Wait For',
+    'Digital Input 3 Wait For',
+    'Digital Input 4 Wait For',
+    'Digital Input 5 Wait For',
+    'Digital Input 6 Wait For',
+    'Digital Input 7 Wait For',
+    'Digital Input 8 Wait For',
+))
+
+
 def profile_step_guaranteed_soak_wait(value):
-    bit_array = bitfield(value)
-    response = {
-        'Guaranteed Soak Loop 1': state_alarm[bit_array[0]],
-        'Guaranteed Soak Loop 2': state_alarm[bit_array[1]],
-        'Guaranteed Soak Loop 3': state_alarm[bit_array[2]],
-        'Guaranteed Soak Loop 4': state_alarm[bit_array[3]],
-        'Guaranteed Soak Loop 5': state_alarm[bit_array[4]],
-        'Digital Input 1 Wait For': state_alarm[bit_array[5]],
-        'Digital Input 2 Wait For': state_alarm[bit_array[6]],
-        'Digital Input 3 Wait For': state_alarm[bit_array[7]],
-        'Digital Input 4 Wait For': state_alarm[bit_array[8]],
-        'Digital Input 5 Wait For': state_alarm[bit_array[9]],
-        'Digital Input 6 Wait For': state_alarm[bit_array[10]],
-        'Digital Input 7 Wait For': state_alarm[bit_array[11]],
-        'Digital Input 8 Wait For': state_alarm[bit_array[12]],
-    }
-    return response
+    return flags_profile_step_guaranteed_soak_wait.as_dict(value)
 
 
 state_profile_wait_for_loop_event = {
@@ -2396,3 +2527,360 @@ class ProfileSteps(ctypes.BigEndianStructure):
                ),
             )
         )
+
+
+# ---------------------------------------------
+# Lookup tables
+# ---------------------------------------------
+# Built once at import, after every register method is defined.
+# Indexed by register number, so decoding never scans ctrl_registers
+# or builds a getattr string.
+ctrl_register_count = max(ctrl_registers.itervalues()) + 1
+
+# register => name, None where the register is not in the map
+ctrl_register_names = [None] * ctrl_register_count
+
+# register => getter, None where the register is write only or undefined
+ctrl_register_decoders = [None] * ctrl_register_count
+
+# name => setter, only for writeable registers
+ctrl_register_encoders = {}
+
+for _name, _reg in ctrl_registers.iteritems():
+    ctrl_register_names[_reg] = _name
+    _getter = getattr(this_module, _name.lower(), None)
+    if callable(_getter):
+        ctrl_register_decoders[_reg] = _getter
+    _setter = getattr(this_module, "set_{}".format(_name.lower()), None)
+    if callable(_setter):
+        ctrl_register_encoders[_name] = _setter
+
+del _name, _reg, _getter, _setter
+
+# register => BitFlags for the bit oriented registers
+ctrl_register_bitflags = {
+    ctrl_registers['CHAMBER_MANUAL_EVENT_CONTROL']: flags_event_control,
+    ctrl_registers['CUSTOMER_MANUAL_EVENT_CONTROL']: flags_event_control,
+    ctrl_registers['EZT570I_ALARM_STATUS']: flags_ezt570i_alarm_status,
+    ctrl_registers['INPUT_ALARM_STATUS']: flags_input_alarm_status,
+    ctrl_registers['CHAMBER_ALARM_STATUS']: flags_chamber_alarm_status,
+    ctrl_registers['REFRIGERATION_ALARM_STATUS']: flags_refrigeration_alarm_status,
+    ctrl_registers['SYSTEM_STATUS_MONITOR']: flags_system_status_monitor,
+}
+
+# register => divisor turning the raw int16 into engineering units,
+# NaN where the register holds an enum, bitfield or packed bytes
+# -32768 - 32767 (-3276.8 - 3276.7) tenths registers
+# -10000 - 10000 (-100.00 - 100.00) percent output registers
+ctrl_register_tens_suffixes = (
+    '_SETPOINT',
+    '_SETPOINT_LIMIT',
+    '_PROCESS_VALUE',
+    '_HYSTERESIS',
+    '_RAMP_RATE_LIMIT',
+    '_DEUPOINT_LIMIT',
+    '_DUEPOINT_ACTUAL',
+)
+ctrl_register_hundreds_suffixes = (
+    '_PERCENT_OUTPUT',
+)
+ctrl_register_divisors = array.array('d', [float('nan')] * ctrl_register_count)
+for _name, _reg in ctrl_registers.iteritems():
+    if _name.endswith(ctrl_register_tens_suffixes):
+        ctrl_register_divisors[_reg] = 10.0
+    elif _name.endswith(ctrl_register_hundreds_suffixes):
+        ctrl_register_divisors[_reg] = 100.0
+
+del _name, _reg
+
+
+# register => how often the value changes, used for read cache TTLs
+#   live:     process values, clock, status words, anything driven by a running profile
+#   setpoint: LOOP_n_SETPOINT, written by the operator but ramped by a running profile
+#   slow:     operator controls and profile bookkeeping
+#   static:   configuration (limits, alarm settings, recovery modes)
+# Write only registers are live so they are never cached.
+ctrl_register_live_names = (
+    'OPERATIONAL_MODE',
+    'CLOCK_YY_MM',
+    'CLOCK_DAY_DOW',
+    'CLOCK_HH_MM',
+    'CLOCK_SEC',
+    'DEFROST_STATUS',
+    'TIME_REMAINING_UNTIL_NEXT_DEFROST',
+    'CONDENSATION_CONTROL_DEUPOINT_LIMIT',
+    'CONDENSATION_CONTROL_DUEPOINT_ACTUAL',
+    'PROFILE_CONTROL_STATUS',
+    'PROFILE_ADVANCE_STEP',
+    'PROFILE_CURRENT_STEP',
+    'PROFILE_TIME_LEFT_IN_CURRENT_STEP_HHH',
+    'PROFILE_TIME_LEFT_IN_CURRENT_STEP_MM_SS',
+    'PROFILE_WAIT_FOR_STATUS',
+    'PROFILE_WAIT_FOR_SETPOINT',
+    'PROFILE_CURRENT_JUMP_STEP',
+    'PROFILE_JUMPS_REMAINING_IN_CURRENT_STEP',
+    'PROFILE_LAST_JUMP_FROM_STEP',
+    'PROFILE_LAST_JUMP_TO_STEP',
+    'PROFILE_TOTAL_JUMPS_MADE',
+    'ALARM_ACKNOWLEDGE',
+    'EZT570I_ALARM_STATUS',
+    'INPUT_ALARM_STATUS',
+    'CHAMBER_ALARM_STATUS',
+    'REFRIGERATION_ALARM_STATUS',
+    'SYSTEM_STATUS_MONITOR',
+    'PROFILE_STEP_TIME_ADJUSTMENT',
+    'EZT570I_OFFLINE_DOWNLOAD_PROFILE',
+)
+ctrl_register_live_suffixes = (
+    '_TARGET_SETPOINT',
+    '_PROCESS_VALUE',
+    '_PERCENT_OUTPUT',
+    '_AUTOTUNE_STATUS',
+)
+ctrl_register_slow_names = (
+    'CHAMBER_LIGHT_CONTROL',
+    'CHAMBER_MANUAL_EVENT_CONTROL',
+    'CUSTOMER_MANUAL_EVENT_CONTROL',
+    'PROFILE_START_STEP',
+    'PROFILE_LAST_STEP',
+)
+ctrl_register_slow_prefixes = (
+    'PROFILE_NAME_',
+    'PROFILE_START_DATE_',
+    'PROFILE_STOP_DATE_',
+)
+ctrl_register_classes = ['live'] * ctrl_register_count
+for _name, _reg in ctrl_registers.iteritems():
+    if _name in ctrl_register_live_names or _name.endswith(ctrl_register_live_suffixes):
+        ctrl_register_classes[_reg] = 'live'
+    elif _name in ctrl_register_slow_names or _name.startswith(ctrl_register_slow_prefixes):
+        ctrl_register_classes[_reg] = 'slow'
+    elif _name.startswith('LOOP_') and _name.endswith('_SETPOINT') and \
+            _name.count('_') == 2:
+        # LOOP_n_SETPOINT follows the profile ramp
+        ctrl_register_classes[_reg] = 'setpoint'
+    else:
+        ctrl_register_classes[_reg] = 'static'
+
+del _name, _reg
+
+
+def register_divisors(start_reg, quantity):
+    """Divisors for a span of registers, NaN padded past the map"""
+    divisors = ctrl_register_divisors[start_reg:start_reg + quantity]
+    divisors.extend([float('nan')] * (quantity - len(divisors)))
+    return divisors
+
+
+def scaled_value(reg, raw):
+    """Engineering units for analog registers, the raw int for everything else"""
+    if 0 <= reg < ctrl_register_count:
+        divisor = ctrl_register_divisors[reg]
+        if divisor == divisor:  # NaN for non analog registers
+            return raw / divisor
+    return int(raw)
+
+
+def decode_raw_value(reg, value, scaled=True):
+    """Fast path, no dict or string building.
+    :param scaled: True for engineering units (float) on analog registers,
+        False for the untouched int16
+    """
+    if scaled:
+        return scaled_value(reg, value)
+    return int(value)
+
+
+def decode_raw_block(start_reg, values, scaled=True):
+    """Fast path for a block of registers
+    :return: array('d') of scaled_value per register when scaled,
+        else array('h') of the untouched int16 values
+    """
+    if not scaled:
+        return array.array('h', values)
+    divisors = register_divisors(start_reg, len(values))
+    return array.array('d', [
+        value / divisor if divisor == divisor else value
+        for value, divisor in zip(values, divisors)
+    ])
+
+
+def encode_scaled_value(reg, value):
+    """Inverse of scaled_value, engineering units to the int16 to write"""
+    if 0 <= reg < ctrl_register_count:
+        divisor = ctrl_register_divisors[reg]
+        if divisor == divisor:
+            value = int(round(value * divisor))
+    value = int(value)
+    if not -32768 <= value <= 32767:
+        raise ValueError("register {} value {} out of int16 range".format(reg, value))
+    return value
+
+
+class RegisterBlock(object):
+    """Decoded block of contiguous registers.
+    raw holds the untouched int16 values (the enum and bitfield codes),
+    analog holds engineering units for analog registers, NaN elsewhere.
+    Human readable strings are only built by human()
+    """
+    __slots__ = ('start_reg', 'raw', 'analog')
+
+    def __init__(self, start_reg, raw, analog):
+        self.start_reg = start_reg
+        self.raw = raw
+        self.analog = analog
+
+    def __len__(self):
+        return len(self.raw)
+
+    def index(self, reg):
+        """Offset into the block for a register number or name"""
+        reg = ctrl_registers.get(reg, reg)
+        offset = reg - self.start_reg
+        if not 0 <= offset < len(self.raw):
+            raise IndexError("register {} not in block".format(reg))
+        return offset
+
+    def is_analog(self, reg):
+        offset = self.index(reg)
+        return self.analog[offset] == self.analog[offset]  # NaN != NaN
+
+    def code(self, reg):
+        """Raw int16 value, the enum or bitfield code"""
+        return int(self.raw[self.index(reg)])
+
+    def value(self, reg):
+        """Float for analog registers, int code for everything else"""
+        offset = self.index(reg)
+        analog = self.analog[offset]
+        if analog == analog:
+            return float(analog)
+        return int(self.raw[offset])
+
+    def human(self, reg):
+        """Human readable decode, same as decode_read_value"""
+        offset = self.index(reg)
+        return decode_read_value(self.start_reg + offset, int(self.raw[offset]))
+
+    def items(self):
+        """(register, value) pairs, see value()"""
+        return [
+            (self.start_reg + offset, self.value(self.start_reg + offset))
+            for offset in range(len(self.raw))
+        ]
+
+
+def decode_register_block(start_reg, values):
+    """
+    Scale a whole block of raw registers in one pass.
+    :param start_reg: register of values[0]
+    :param values: numpy int16 array, array('h'), or any iterable of int
+        (e.g. the ctypes data array of a read response)
+    :return: RegisterBlock
+    """
+    if numpy is not None and isinstance(values, numpy.ndarray):
+        raw = values.astype(numpy.int16, copy=False)
+        divisors = numpy.asarray(register_divisors(start_reg, len(raw)), dtype=numpy.float64)
+        return RegisterBlock(start_reg, raw, raw / divisors)
+
+    if not isinstance(values, array.array) or values.typecode != 'h':
+        values = array.array('h', values)
+    divisors = register_divisors(start_reg, len(values))
+    analog = array.array('d', map(operator.truediv, values, divisors))
+    return RegisterBlock(start_reg, values, analog)
+
+
+# ---------------------------------------------
+# Decode cache
+# ---------------------------------------------
+class FrozenDict(dict):
+    """Read only dict, so one decoded value can be shared by every caller"""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("decoded register values are read only")
+
+    __setitem__ = _read_only
+    __delitem__ = _read_only
+    clear = _read_only
+    pop = _read_only
+    popitem = _read_only
+    setdefault = _read_only
+    update = _read_only
+
+    def __hash__(self):
+        return hash(frozenset(self.items()))
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+
+def freeze(decoded):
+    """Make a decoded value safe to share"""
+    if isinstance(decoded, dict):
+        return FrozenDict(decoded)
+    if isinstance(decoded, (tuple, list)):
+        return tuple(freeze(item) for item in decoded)
+    return decoded
+
+
+class DecodeCache(object):
+    """LRU bounded memo in front of decode_read_value, keyed by (register, raw value).
+    Most polled registers hold the same raw value for hours,
+    so the decoded result is built once and shared.
+    Safe to share between threads and between chambers.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def decode(self, reg, value):
+        key = (reg, int(value))
+        with self._lock:
+            try:
+                # pop and re-insert to mark as most recently used
+                decoded = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries[key] = decoded
+                self.hits += 1
+                return decoded
+
+        decoded = freeze(decode_read_value(reg, key[1]))
+
+        with self._lock:
+            self._entries[key] = decoded
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return decoded
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+
+# Shared by every Chamber in the process
+decode_cache = DecodeCache()
+
+
+def cached_decode_read_value(reg, value):
+    """decode_read_value through the shared decode_cache, returns read only values"""
+    return decode_cache.decode(reg, value)
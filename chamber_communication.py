@@ -24,37 +24,60 @@ By John Stile At Meyer Sound Laboratories Inc.
 this is distributed under a MIT license, see LICENSE
 """
 
+import array  # for blocks of int16 register values
 import binascii  # for human readable access to bit packed data
 import ctypes  # to access binary packed data in calibration file
 import struct  # for crc and message packing
 import socket  # for tcp communication
 
-import itertools
 import serial  # for rs232 communication
 import logging  # for log facility
+import threading
 import time
 import retrying
 
 import modbus_packets
 import chamber_commands
+import chamber_profile
+import profile_render
+
+# Profile area: header at 200-214, step n at 200 + 15 * n
+PROFILE_START = 200
+PROFILE_BLOCK_SIZE = 15
+# Manual 2.5.2: the EZT drops a profile download 15 s after the last packet it
+# received and clears its buffer. A download that failed part way is sent again
+# from the header once that has passed, plus a margin.
+PROFILE_DOWNLOAD_TIMEOUT = 20.0
 
-def int_or_float(s):
-    """
-    Modbus can't handle decimals, so we multiply any float by 10.
-    :param s: string representation of a numeric value.
-    :return: int
-    """
-    try:
-        return int(s)
-    except ValueError:
-        # if we have a float,
-        # protocol requires multiply by 10 and cast to int
-        return int(float(s) * 10)
 
 def retry_if_crc_error(exception):
     """Return True if we should retry (in this case when it's a CRC error), False otherwise"""
     return isinstance(exception, CRCError)
 
+
+class ProfileUpload(object):
+    """Progress of one profile upload, so a failed upload can be sent again"""
+
+    def __init__(self, packets):
+        """
+        :param packets: list of WriteProfileSend, in upload order
+        """
+        self.packets = packets
+        # packets confirmed by a matching WriteProfileResponse
+        self.acknowledged = 0
+        # time.time() the upload stopped part way, None while it hasn't
+        self.failed = None
+
+    @property
+    def done(self):
+        return self.acknowledged >= len(self.packets)
+
+    def __repr__(self):
+        return "ProfileUpload({}/{} acknowledged)".format(
+            self.acknowledged, len(self.packets)
+        )
+
+
 class ChamberCommunication(object):
     """Communication with EZT570i"""
 
@@ -109,6 +132,15 @@ class ChamberCommunication(object):
         # receive messages between the host computer and multiple EZT’s on the serial link. With a
         # default timeout period in the EZT-570i of 200ms, it makes a total pause of 203ms minimum.
         self.comm_wait_time = 0.203
+        # Read Register(s) Command (0x03) returns from 1 to 60 registers.
+        self.max_read_registers = 60
+        # profile_cache.ProfileCache, skips parsing and packing in load_profile
+        self.profile_cache = None
+        # ProfileUpload of the last write_profile_to_modbus, see resume()
+        self.profile_upload = None
+        # Held for each request + response, so threads sharing this connection
+        # (AlarmWatcher, ImagePublisher) never interleave frames on the bus
+        self.bus_lock = threading.RLock()
 
     def connect(self):
         if self.comm_type == 'network':
@@ -127,12 +159,26 @@ class ChamberCommunication(object):
         # Get communication
         self.comm_func[self.comm_type]['disconnect']()
 
+    def transaction(self, request, response, wait=0.0):
+        """
+        Send a request and read its response as one unit, holding bus_lock
+        :param request: ctypes packet to send
+        :param response: ctypes Structure sized for the expected response
+        :param wait: seconds to pause between sending and reading
+        :return: response, populated
+        """
+        with self.bus_lock:
+            self.comm_func[self.comm_type]['write'](request)
+            if wait:
+                time.sleep(wait)
+            return self.read_response(response)
+
     def write_register(self, register, value):
         """
         Set the value of a register
         :param register: Address of register
         :param value: Value of to write.
-        :return:
+        :return: WriteRegister, the echo of register and value
         """
         self.log.debug(
             "\n"
@@ -151,7 +197,7 @@ class ChamberCommunication(object):
             self.chamber_number,
             self.command['write_reg'],
             register,
-            value
+            value & 0xFFFF  # int16 registers, negative values as two's complement
         )
         self.log.debug(
             "{:<80}:packed header".format(
@@ -182,18 +228,13 @@ class ChamberCommunication(object):
             )
         )
         # --------------------------------------
-        # Send request
-        # --------------------------------------
-        self.comm_func[self.comm_type]['write'](modbus_write_request)
-
-        # --------------------------------------
-        # Read response
+        # Send request, read response
         # --------------------------------------
 
         # Create response Structure sized for expected data
         modbus_write_response = modbus_packets.WriteRegister()
 
-        modbus_response = self.read_response(modbus_write_response)
+        modbus_response = self.transaction(modbus_write_request, modbus_write_response)
 
         self.log.debug(
             (
@@ -202,6 +243,7 @@ class ChamberCommunication(object):
                 modbus_response
             )
         )
+        return modbus_response
 
     def read_registers(self, register, quantity):
         """
@@ -261,17 +303,30 @@ class ChamberCommunication(object):
             )
         )
 
-        # Send modbus request
-        self.comm_func[self.comm_type]['write'](modbus_read_request)
-
         # Create response Structure sized for expected data
         modbus_read_response = modbus_packets.read_response_factory(quantity)
 
-        # Read modbus response
-        modbus_response = self.read_response(modbus_read_response)
+        # Send modbus request, read modbus response
+        modbus_response = self.transaction(modbus_read_request, modbus_read_response)
 
         return modbus_response
 
+    def read_register_span(self, register, quantity):
+        """
+        Read any number of contiguous registers in the fewest legal reads
+        :param register: Starting register
+        :param quantity: How many registers to read, may exceed max_read_registers
+        :return: array('h') of register values
+        """
+        values = array.array('h')
+        end = register + quantity
+        while register < end:
+            chunk = min(self.max_read_registers, end - register)
+            modbus_response = self.read_registers(register, chunk)
+            values.extend(modbus_response.data)
+            register += chunk
+        return values
+
     def read_response(self, modbus_response):
 
         size_read_response = ctypes.sizeof(modbus_response)
@@ -306,71 +361,21 @@ class ChamberCommunication(object):
         return modbus_response
 
     def print_profile(self, project_file):
+        """Log the profile as one step table, see profile_render"""
+        profile = chamber_profile.read_profile(project_file)
         self.log.info(
             (
                 "\n"
                 "# =========================================\n"
                 "# PRINT PROFILE: {}\n"
-                "# ========================================="
+                "# =========================================\n"
+                "{}"
             ).format(
-                project_file
-            )
-        )
-        # Read file into list of profile steps
-        with open(project_file) as fh:
-
-            # Harvest the first line
-            profile_header = self.read_profile_lines(fh, 1)
-            self.log.info("Step:{}".format(profile_header))
-
-            # Load Header into cyptes.Structure
-            profile_header_bytes = struct.pack('!15H', *profile_header[0])
-            profile_header_struct = chamber_commands.ProfileHeader()
-            ctypes.memmove(
-                ctypes.addressof(profile_header_struct),
-                profile_header_bytes,
-                len(profile_header_bytes)
+                project_file,
+                profile_render.render_profile(profile)
             )
-            self.log.info("Profile Header:\n{}".format(profile_header_struct))
-
-            # Determine how many steps to read from file
-            steps_tot = profile_header[0][9]
-            self.log.info("Steps in Profile:{}".format(steps_tot))
-
-            # Read steps from file
-            profile_steps = self.read_profile_lines(fh, steps_tot)
-            self.log.debug("Steps loaded:{}".format(len(profile_steps)))
-
-            register_start = 200  # First Register Address 0x00c8
-            registers_to_write = 15  # data registers per packet
-
-            for i, step in enumerate(profile_steps):
-                register_start += registers_to_write
-
-                # Load Steps into cyptes.Structure
-                profile_step_bytes = struct.pack('!15h', *step)
-                profile_step_struct = chamber_commands.ProfileSteps(register_start)
-                ctypes.memmove(
-                    ctypes.addressof(profile_step_struct),
-                    profile_step_bytes,
-                    len(profile_step_bytes)
-                )
-                self.log.info(
-                    (
-                        "\n=========================================\n"
-                        "Step:{}\n"
-                        "=========================================\n"
-                        "{}"
-                    ).format(
-                        i+1,
-                        profile_step_struct
-                    )
-                )
-
-        # Convert profile header+steps into list of modbus packets
-        modbus_packed_profile = self.profile_to_modbus_packets(
-            profile_header, profile_steps
         )
+        return profile
 
     def load_profile(self, project_file):
         """
@@ -389,49 +394,131 @@ class ChamberCommunication(object):
             )
         )
 
-        # Read file into list of profile steps
-        with open(project_file) as fh:
+        modbus_packed_profile = self.compile_profile_file(project_file)
 
-            # Harvest the first line
-            profile_header = self.read_profile_lines(fh, 1)
-            self.log.debug("Profile Header:{}".format(profile_header))
+        # Send over the wire
+        self.write_profile_to_modbus(modbus_packed_profile)
 
-            # Determine how many steps to read from file
-            steps_tot = profile_header[0][9]
-            self.log.info("Steps in Profile:{}".format(steps_tot))
+    def compile_profile_file(self, project_file):
+        """
+        Packets for a CSZ Profile file, from profile_cache when one is set
+        :return: list of WriteProfileSend, header first
+        :raise: chamber_profile.ProfileParseError
+        """
+        if self.profile_cache is not None:
+            # Compiled frames keyed by file content + chamber_number
+            return self.profile_cache.load(self, project_file)
+        with open(project_file) as fh:
+            return self.compile_profile(fh)
 
-            # Read steps from file
-            profile_steps = self.read_profile_lines(fh, steps_tot)
-            self.log.debug("Steps loaded:{}".format(len(profile_steps)))
+    def compile_profile(self, fh):
+        """
+        Parse a CSZ Profile file and build the modbus packets to upload it
+        :param fh: open profile file
+        :return: list of WriteProfileSend, header first
+        :raise: chamber_profile.ProfileParseError
+        """
+        # Header first, detects GALAXY/GALILEO layout, steps validated
+        profile = chamber_profile.ProfileReader(fh).profile()
+        self.log.debug("Profile Header:{}".format(profile.header))
+        self.log.info("Steps in Profile:{} ({} layout)".format(len(profile), profile.layout))
 
         # Convert profile header+steps into list of modbus packets
-        modbus_packed_profile = self.profile_to_modbus_packets(
-            profile_header, profile_steps
-        )
+        modbus_packed_profile = self.profile_packets(profile)
 
         self.log.debug("Profile Packets")
         for i in modbus_packed_profile:
             self.log.debug("Packet:{}".format(i))
+        return modbus_packed_profile
 
-        # Send over the wire
-        self.write_profile_to_modbus(modbus_packed_profile)
+    @staticmethod
+    def packets_profile(modbus_packed_profile):
+        """
+        The chamber_profile.Profile a list of packets writes, e.g. to validate
+        cached packets without reading the file again
+        :param modbus_packed_profile: list of WriteProfileSend, header first
+        """
+        return chamber_profile.Profile.from_blocks(
+            list(modbus_packed_profile[0].data),
+            [list(packet.data) for packet in modbus_packed_profile[1:]]
+        )
+
+    def profile_packets(self, profile):
+        """
+        Convert a chamber_profile.Profile to modbus packets, one per block
+        The data bytes come straight from profile.payload(), no per value packing.
+        :param profile: chamber_profile.Profile
+        :return: list of WriteProfileSend, header first
+        """
+        modbus_packed_profile = []
+        for index in xrange(profile.blocks):
+            packed_header = struct.pack(
+                '!2B2HB',
+                self.chamber_number,
+                self.command['write_profile_reg'],
+                PROFILE_START + PROFILE_BLOCK_SIZE * index,
+                PROFILE_BLOCK_SIZE,
+                2 * PROFILE_BLOCK_SIZE
+            )
+            modbus_msg_as_bytes = self.crc.add_crc(packed_header + profile.payload(index)[:])
+            modbus_request = modbus_packets.write_profile_factory(PROFILE_BLOCK_SIZE)
+            ctypes.memmove(
+                ctypes.addressof(modbus_request),
+                modbus_msg_as_bytes,
+                len(modbus_msg_as_bytes)
+            )
+            modbus_packed_profile.append(modbus_request)
+        return modbus_packed_profile
 
     def write_profile_to_modbus(self, modbus_packed_profile):
         """
         Write profile packets to modbus
+        Progress is kept in self.profile_upload, if this raises call resume()
         :param modbus_packed_profile:
         :return:
         """
         self.log.info("Load Profile")
+        self.profile_upload = ProfileUpload(modbus_packed_profile)
+        self.resume()
 
-        for i, packet in enumerate(modbus_packed_profile):
-            self.log.info("--------------Line:{} --------------".format(i))
-            #---------------------------------------
-            # Write lines, and retry if a problem
-            #---------------------------------------
-            self.write_profile_lines(packet)
+    def resume(self):
+        """
+        Send the last profile upload again, after it failed part way
+        A step that failed can't be sent again on its own: the header told the
+        EZT how many steps follow, when they stop coming it drops the download
+        and clears its buffer. So wait until PROFILE_DOWNLOAD_TIMEOUT has passed
+        since the failure, then start over from the header.
+        :return: ProfileUpload
+        """
+        upload = self.profile_upload
+        if upload is None or upload.done:
+            return upload
+        if upload.failed is not None:
+            wait = upload.failed + PROFILE_DOWNLOAD_TIMEOUT - time.time()
+            if wait > 0:
+                self.log.info(
+                    "Profile upload failed at line {}, waiting {:.1f}s for the "
+                    "chamber to drop it".format(upload.acknowledged, wait)
+                )
+                time.sleep(wait)
+            upload.acknowledged = 0
+            upload.failed = None
+
+        try:
+            while not upload.done:
+                i = upload.acknowledged
+                self.log.info("--------------Line:{} --------------".format(i))
+                #---------------------------------------
+                # Write lines, and retry if a problem
+                #---------------------------------------
+                self.write_profile_lines(upload.packets[i])
+                upload.acknowledged = i + 1
+        finally:
+            if not upload.done:
+                upload.failed = time.time()
 
         self.log.info("Profile upload complete")
+        return upload
 
     @retrying.retry(
         stop_max_delay=40000,
@@ -443,24 +530,15 @@ class ChamberCommunication(object):
         self.log.debug(
             'WriteProfileSend:{}'.format(packet)
         )
-        # --------------------------------------
-        # Send request
-        # --------------------------------------
-        self.comm_func[self.comm_type]['write'](packet)
-
-        # --------------------------------------
-        # Mandatory wait between each write
-        # --------------------------------------
-        time.sleep(self.comm_wait_time)
-
-        # --------------------------------------
-        # Read response
-        # --------------------------------------
-
         # Create response Structure sized for expected data
         modbus_write_profile_response = modbus_packets.WriteProfileResponse()
 
-        modbus_response = self.read_response(modbus_write_profile_response)
+        # --------------------------------------
+        # Send request, mandatory wait between each write, read response
+        # --------------------------------------
+        modbus_response = self.transaction(
+            packet, modbus_write_profile_response, self.comm_wait_time
+        )
 
         # Print structure
         self.log.debug(
@@ -471,110 +549,17 @@ class ChamberCommunication(object):
             )
         )
 
-    def read_profile_lines(self, fh, lines):
-        """
-        Read the profile file, converting to list of int
-        :param fh:
-        :param lines:
-        :return:
-        """
-        self.log.debug("Read the profile file, converting to list of int")
-        data_all_lines = []
-        for i in xrange(lines):
-            # Convert comma separated text to array of int, with 15 elements
-            data_int_array = []
-            data_list = fh.readline().strip().split(',')[:15]
-            self.log.debug("data_str:{}".format(data_list))
-            for val in data_list:
-                # Convert string to int, floats are multiplied by 10
-                val = int_or_float(val)
-                # Finally add to the array
-                data_int_array.append(val)
-
-            self.log.debug("data_int_array:{}".format(data_int_array))
-            data_all_lines.append(data_int_array)
-        return data_all_lines
-
-    def profile_to_modbus_packets(self, profile_header, profile_steps):
-        """
-        Convert list of int to list of modbus packets
-        :param profile_header:
-        :param profile_steps:
-        :return: list of WriteProfileSend
-        """
-        self.log.debug("Convert list of int to list of modbus packets")
-        modbus_packed_profile = []
-
-        register_start = 200  # First Register Address 0x00c8
-        registers_to_write = 15  # data registers per packet
-        bytes_written = 30   # data bytes in each packet
-
-        for line, data_int_array in enumerate(itertools.chain(profile_header, profile_steps)):
-            # Increment the starting register address by 15 for consecutive elements
-            # First is 200, second is 215, third is 230, ....
-            if line:
-                register_start += registers_to_write
-
-            # --------------------------------------
-            # Convert array of int to packed data
-            # --------------------------------------
-            data_bytearray = bytearray()
-            for i in data_int_array:
-                s = struct.pack('!h', i)
-                data_bytearray += s
-
-            data_hexstring = binascii.hexlify(data_bytearray)
-            self.log.debug("{:<80}:data_bytearray".format(data_hexstring))
-
-            # --------------------------------------
-            # PACKET HEADER FOR PROFILE WRITE
-            # --------------------------------------
-            fmt = '!2B2HB'
-            packed_header = struct.pack(
-                fmt,
-                self.chamber_number,
-                self.command['write_profile_reg'],
-                register_start,
-                registers_to_write,
-                bytes_written
-            )
-            self.log.debug(
-                "{:<80}:packed header".format(
-                    [hex(a) for a in struct.unpack(fmt, packed_header)]
+        # The response echoes where and how much was written. A CRC valid frame
+        # that doesn't is not a line error, so ResponseError is not retried;
+        # resume() sends the whole profile again. Dummy has no response.
+        if self.comm_type != 'dummy' and (
+                modbus_response.reg != packet.reg or modbus_response.qty != packet.quantity):
+            raise ResponseError(
+                "WriteProfileResponse reg:{} qty:{}, sent reg:{} qty:{}".format(
+                    modbus_response.reg, modbus_response.qty, packet.reg, packet.quantity
                 )
             )
-
-            # --------------------------------------
-            # JOIN HEADER + DATA
-            # --------------------------------------
-            msg_as_bytes = bytes(packed_header) + bytes(data_bytearray)
-
-            data_hexstring = binascii.hexlify(msg_as_bytes)
-            self.log.debug("{:<80}:msg_as_bytes".format(data_hexstring))
-
-            # --------------------------------------
-            # Add CRC
-            # --------------------------------------
-            modbus_msg_as_bytes = self.crc.add_crc(msg_as_bytes)
-
-            data_hexstring = binascii.hexlify(modbus_msg_as_bytes)
-            self.log.debug("{:<80}:msg_as_bytes + crc".format(data_hexstring))
-
-            # --------------------------------------
-            # Load ctypes.Structure
-            # --------------------------------------
-            modbus_profile_request = modbus_packets.write_profile_factory(registers_to_write)
-            ctypes.memmove(
-                ctypes.addressof(modbus_profile_request),
-                modbus_msg_as_bytes,
-                len(modbus_msg_as_bytes)
-            )
-            # --------------------------------------
-            # Append to list of packed data
-            # --------------------------------------
-            modbus_packed_profile.append(modbus_profile_request)
-
-        return modbus_packed_profile
+        return modbus_response
 
     def create_com_network(self):
         """Network Setup"""
@@ -738,6 +723,16 @@ class CRCError(Exception):
     pass
 
 
+class ResponseError(Exception):
+    """ Raised when a response doesn't echo the request it answers. """
+    pass
+
+
+class WriteVerifyError(Exception):
+    """ Raised when the chamber does not hold the value just written. """
+    pass
+
+
 if __name__ == '__main__':
     # --------------------
     # Logging setup
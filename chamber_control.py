@@ -8,19 +8,52 @@ this is distributed under a MIT license, see LICENSE
 """
 
 
+import contextlib
 import logging
 import time
 from copy import copy
 import chamber_commands
 import chamber_communication
+import chamber_state
+import profile_validator
+import register_cache
+
+# set_register verification
+#   echo:     compare the FC06 echo, no extra round trip
+#   readback: read the register back and compare
+#   deferred: queue for verify_writes(), one block read for many writes
+#   none:     trust the write, always used with comm_type 'dummy'
+VERIFY_MODES = ('echo', 'readback', 'deferred', 'none')
 
 
 class Chamber(object):
     """EZT570i Chamber functional interface"""
 
-    def __init__(self, log, comm_params):
+    def __init__(self, log, comm_params, cache_ttls=None, write_deadband=None,
+                 verify='echo', profile_cache=None):
+        """
+        :param cache_ttls: dict of register class ('live', 'setpoint', 'slow', 'static')
+            => seconds a read stays cached, see register_cache.DEFAULT_TTLS
+        :param write_deadband: opt in, None writes every set_register. 0.0 skips
+            repeats of the value last read or written while it is within its TTL,
+            more also skips analog writes within this many engineering units.
+            Live and write only registers (commands) are always written.
+        :param verify: default set_register verification, one of VERIFY_MODES
+        :param profile_cache: profile_cache.ProfileCache, reuse compiled profiles
+        """
+        assert verify in VERIFY_MODES, verify
         self.log = log
         self.ccomm = chamber_communication.ChamberCommunication(comm_params, log)
+        self.cache = register_cache.RegisterCache(cache_ttls, write_deadband)
+        self.ccomm.profile_cache = profile_cache
+        self.verify = verify
+        # register => (reg_name, code) written with verify='deferred'
+        self.pending_verify = {}
+        # profile_validator.ProfileLimits, see profile_limits()
+        self._profile_limits = None
+        # event register name => [mask of bits to set, mask of bits to clear]
+        self._event_changes = {}
+        self._event_burst = 0
 
     def connect(self):
         self.ccomm.connect()
@@ -28,22 +61,282 @@ class Chamber(object):
     def disconnect(self):
         self.ccomm.disconnect()
 
-    def get_register(self, reg_name):
-        """Return value given human readable register name"""
+    def read_register(self, reg_name, fresh=False):
+        """Read one register through the TTL cache
+        :param fresh: skip the cache and read the chamber
+        :return: register_cache.RegisterRead, .cached tells where the value came from
+        """
         start_reg = chamber_commands.name_to_reg(reg_name)
+        if not fresh:
+            cached = self.cache.lookup(start_reg)
+            if cached is not None:
+                return cached
         values = self.ccomm.read_registers(start_reg, 1)
         self.log.debug("Modbus Response:{}".format(values))
-        value_human = chamber_commands.decode_read_value(start_reg, values.data[0])
+        timestamp = time.time()
+        self.cache.store(start_reg, values.data[0], timestamp)
+        return register_cache.RegisterRead(start_reg, values.data[0], timestamp, False)
+
+    def invalidate_cache(self, reg_names=None):
+        """Forget cached reads of some registers, or of all when reg_names is None"""
+        if reg_names is None:
+            self.cache.invalidate()
+        else:
+            self.cache.invalidate(chamber_commands.name_to_reg(name) for name in reg_names)
+
+    def get_register(self, reg_name):
+        """Return value given human readable register name"""
+        value_human = self.read_register(reg_name).value
         return value_human
 
-    def set_register(self, reg_name, value):
-        """Set value given human readable register name and value"""
+    def get_register_raw(self, reg_name, scaled=True):
+        """Return a plain number given human readable register name
+        :param scaled: float engineering units for analog registers, else the untouched int16
+        """
+        read = self.read_register(reg_name)
+        return chamber_commands.decode_raw_value(read.reg, read.raw, scaled)
+
+    def get_registers_raw(self, reg_name, quantity, scaled=True):
+        """Return plain numbers for contiguous registers starting at reg_name
+        :param scaled: array('d') of engineering units, else array('h') of untouched int16
+        """
+        start_reg = chamber_commands.name_to_reg(reg_name)
+        raw = self.ccomm.read_register_span(start_reg, quantity)
+        self.cache.store_block(start_reg, raw)
+        if not scaled:
+            return raw
+        return chamber_commands.decode_raw_block(start_reg, raw)
+
+    def set_register(self, reg_name, value, force=False, verify=None):
+        """Set value given human readable register name and value
+        With a write_deadband, skipped when the chamber still holds the value.
+        :param force: write even when the value looks unchanged
+        :param verify: one of VERIFY_MODES, default self.verify
+        :return: True when written, False when skipped
+        :raise: chamber_communication.WriteVerifyError, when the value still
+            doesn't verify after it is written a second time
+        """
         register, code = chamber_commands.encode_set_value(reg_name, value)
-        self.ccomm.write_register(register, code)
+        return self._write_code(reg_name, register, code, force, verify)
+
+    def _write_code(self, reg_name, register, code, force=False, verify=None):
+        """set_register once the value is encoded, see set_register"""
+        verify = verify or self.verify
+        assert verify in VERIFY_MODES, verify
+        if self.ccomm.comm_type == 'dummy':
+            # No chamber answers, nothing to compare against
+            verify = 'none'
+        if not force and self.cache.is_redundant(register, code):
+            self.log.debug("Skip write {}:{}, unchanged".format(reg_name, value))
+            return False
+        code = register_cache.to_int16(code)
+
+        # A mismatch is written once more before WriteVerifyError
+        for attempt in range(2):
+            echo = self.ccomm.write_register(register, code)
+
+            if verify == 'echo':
+                echoed = register_cache.to_int16(echo.value)
+                if echo.reg == register and echoed == code:
+                    self.cache.store(register, code)
+                    return True
+                mismatch = "{}: wrote {} to register {}, echo was {} to register {}".format(
+                    reg_name, code, register, echoed, echo.reg
+                )
+            elif verify == 'readback':
+                values = self.ccomm.read_registers(register, 1)
+                self.log.debug("Modbus Response:{}".format(values))
+                self.cache.store(register, values.data[0])
+                if values.data[0] == code:
+                    return True
+                mismatch = "{}: wrote {}, read back {}".format(
+                    reg_name, code, values.data[0]
+                )
+            elif verify == 'deferred':
+                self.cache.store(register, code)
+                self.pending_verify[register] = (reg_name, code)
+                return True
+            else:
+                self.cache.invalidate([register])
+                return True
+
+            self.cache.invalidate([register])
+            if not attempt:
+                self.log.warning("{}, writing again".format(mismatch))
+        raise chamber_communication.WriteVerifyError(mismatch)
+
+    def verify_writes(self):
+        """Check every write made with verify='deferred' in one span read
+        :raise: chamber_communication.WriteVerifyError listing every mismatch
+        """
+        if not self.pending_verify:
+            return
+        pending, self.pending_verify = self.pending_verify, {}
+        if self.ccomm.comm_type == 'dummy':
+            return
+        start_reg = min(pending)
+        raw = self.ccomm.read_register_span(start_reg, max(pending) - start_reg + 1)
+        self.cache.store_block(start_reg, raw)
+
+        mismatches = [
+            "{}: wrote {}, read back {}".format(reg_name, code, raw[register - start_reg])
+            for register, (reg_name, code) in sorted(pending.iteritems())
+            if raw[register - start_reg] != code
+        ]
+        if mismatches:
+            raise chamber_communication.WriteVerifyError(", ".join(mismatches))
+
+    def set_event(self, event, on, reg_name='CUSTOMER_MANUAL_EVENT_CONTROL'):
+        """Turn one manual event on or off, leaving the other events alone
+        :param event: event number 1-15
+        :param reg_name: CUSTOMER_MANUAL_EVENT_CONTROL or CHAMBER_MANUAL_EVENT_CONTROL
+        """
+        self.set_events({event: on}, reg_name)
+
+    def set_events(self, events, reg_name='CUSTOMER_MANUAL_EVENT_CONTROL'):
+        """Change several manual events with one write
+        The mask is read-modify-written, from the cache while the last read or
+        write is within its TTL, so a change usually costs only the write.
+        Inside event_burst() the write waits for the end.
+        :param events: dict of event number 1-15 => True/False
+        """
+        changes = self._event_changes.setdefault(reg_name, [0, 0])
+        for event, on in events.iteritems():
+            assert 1 <= event <= 15, event
+            bit = 1 << (event - 1)
+            if on:
+                changes[0] |= bit
+                changes[1] &= ~bit
+            else:
+                changes[1] |= bit
+                changes[0] &= ~bit
+        if not self._event_burst:
+            self.flush_events()
+
+    @contextlib.contextmanager
+    def event_burst(self):
+        """Merge every set_event in the block into one write per register
+
+            with chamber.event_burst():
+                chamber.set_event(1, True)
+                chamber.set_event(2, False)
+        """
+        self._event_burst += 1
+        try:
+            yield
+        finally:
+            self._event_burst -= 1
+            if not self._event_burst:
+                self.flush_events()
+
+    def flush_events(self):
+        """Write the event changes collected so far
+        A change is dropped only once written, if a write raises the changes
+        not yet written are kept for the next flush.
+        """
+        for reg_name in list(self._event_changes):
+            set_bits, clear_bits = self._event_changes[reg_name]
+            # Within the TTL, so bits changed at the touch screen aren't written back
+            mask = self.read_register(reg_name).raw
+            self.set_register(reg_name, ((mask & ~clear_bits) | set_bits) & 0x7FFF)
+            del self._event_changes[reg_name]
+
+    def read_block(self, reg_name, quantity):
+        """Read contiguous registers starting at human readable register name
+        :return: chamber_commands.RegisterBlock, scaled in one pass
+        """
         start_reg = chamber_commands.name_to_reg(reg_name)
-        quantity_of_reg = 1
-        values = self.ccomm.read_registers(start_reg, quantity_of_reg)
+        values = self.ccomm.read_registers(start_reg, quantity)
         self.log.debug("Modbus Response:{}".format(values))
+        self.cache.store_block(start_reg, values.data)
+        return chamber_commands.decode_register_block(start_reg, values.data)
+
+    def snapshot(self):
+        """Read the whole control area (registers 0-180) in the fewest legal reads
+        :return: chamber_state.Snapshot, decoded lazily on access
+        """
+        raw = self.ccomm.read_register_span(
+            chamber_state.CONTROL_AREA_START,
+            chamber_state.CONTROL_AREA_QUANTITY
+        )
+        timestamp = time.time()
+        self.cache.store_block(chamber_state.CONTROL_AREA_START, raw, timestamp)
+        return chamber_state.Snapshot(raw, timestamp)
+
+    def read_loops(self, loops=None):
+        """Read any subset of loops 1-5 in one contiguous transaction
+        :param loops: iterable of loop numbers, default all five
+        :return: list of chamber_state.LoopView, one per loop
+        """
+        loops, start_reg, quantity = chamber_state.loop_span(loops)
+        raw = self.ccomm.read_register_span(start_reg, quantity)
+        self.cache.store_block(start_reg, raw)
+        return chamber_state.loop_views(raw, loops)
+
+    def write_loop(self, loop, settings, force=False, verify=None):
+        """Write loop settings back, one Write Register (0x06) per setting
+        The manual allows Write Multiple Registers (0x10) for the profile download
+        only, the chamber acknowledges it here without taking the values. Each
+        write is checked and cached like set_register.
+        :param loop: loop number 1-5
+        :param settings: dict of LoopView field => value, e.g. {'setpoint': 25.0}
+        :param force: write even the settings that look unchanged
+        :param verify: one of VERIFY_MODES, default self.verify
+        :return: number of registers written
+        :raise: chamber_communication.WriteVerifyError
+        """
+        start_reg = chamber_state.LOOP_START + chamber_state.LOOP_STRIDE * (loop - 1)
+        writes = chamber_state.register_writes(chamber_state.LoopView, start_reg, settings)
+        written = 0
+        for register, code in writes:
+            reg_name = chamber_commands.reg_value_to_name(register)
+            written += self._write_code(reg_name, register, code, force, verify)
+        return written
+
+    def read_monitor_inputs(self, inputs=None):
+        """Read process values and alarm settings of monitor inputs in one read
+        :param inputs: iterable of input numbers 1-8, default all eight
+        :return: chamber_state.MonitorInputBlock of compact columns
+        """
+        inputs, start_reg, quantity = chamber_state.monitor_input_span(inputs)
+        raw = self.ccomm.read_register_span(start_reg, quantity)
+        self.cache.store_block(start_reg, raw)
+        return chamber_state.MonitorInputBlock(raw, inputs, time.time())
+
+    def read_monitor_process_values(self, inputs=None):
+        """Read only the span holding the process values of the given inputs
+        :param inputs: iterable of input numbers 1-8, default all eight
+        :return: array('d') of process values, in input order
+        """
+        inputs, start_reg, quantity = chamber_state.monitor_input_span(
+            inputs, process_values_only=True
+        )
+        raw = self.ccomm.read_register_span(start_reg, quantity)
+        self.cache.store_block(start_reg, raw)
+        return chamber_state.monitor_process_values(raw, inputs)
+
+    def write_monitor_input(self, monitor_input, settings, force=False, verify=None):
+        """Write monitor input alarm settings, one Write Register (0x06) per setting
+        Like write_loop, the chamber doesn't apply Write Multiple Registers here.
+        :param monitor_input: input number 1-8
+        :param settings: dict of MonitorInputView field => value
+        :param force: write even the settings that look unchanged
+        :param verify: one of VERIFY_MODES, default self.verify
+        :return: number of registers written
+        :raise: chamber_communication.WriteVerifyError
+        """
+        start_reg = (
+            chamber_state.MONITOR_INPUT_START +
+            chamber_state.MONITOR_INPUT_STRIDE * (monitor_input - 1)
+        )
+        writes = chamber_state.register_writes(
+            chamber_state.MonitorInputView, start_reg, settings
+        )
+        written = 0
+        for register, code in writes:
+            reg_name = chamber_commands.reg_value_to_name(register)
+            written += self._write_code(reg_name, register, code, force, verify)
+        return written
 
     def print_read_registers(self, start_reg, values):
         """Mostly for development, to show state of machine"""
@@ -79,14 +372,55 @@ class Chamber(object):
         """Display the profile"""
         self.ccomm.print_profile(project_file)
 
-    def start_profile(self, project_file):
+    def profile_limits(self, max_age=600.0):
+        """Loop setpoint limits and fitted loops/inputs, for profile validation
+        Read with one span read of registers 60-175, then cached on this Chamber.
+        :param max_age: seconds before the limits are read again
+        :return: profile_validator.ProfileLimits
+        """
+        if self._profile_limits is None or self._profile_limits.age > max_age:
+            raw = self.ccomm.read_register_span(
+                profile_validator.LIMITS_START, profile_validator.LIMITS_QUANTITY
+            )
+            self.cache.store_block(profile_validator.LIMITS_START, raw)
+            self._profile_limits = profile_validator.ProfileLimits.from_registers(raw)
+        return self._profile_limits
+
+    def check_profile(self, project_file, packets=None):
+        """Validate a profile file against this chamber, nothing is uploaded
+        :param packets: the file's compiled packets, default compiled (or taken
+            from the profile cache) now
+        :return: chamber_profile.Profile
+        :raise: chamber_profile.ProfileParseError, profile_validator.ProfileValidationError
+        """
+        if packets is None:
+            packets = self.ccomm.compile_profile_file(project_file)
+        profile = self.ccomm.packets_profile(packets)
+        problems = profile_validator.validate_profile(profile, self.profile_limits())
+        if problems:
+            raise profile_validator.ProfileValidationError(problems, project_file)
+        return profile
+
+    def resume_profile_upload(self):
+        """Send a profile upload that failed part way again, see ChamberCommunication.resume"""
+        return self.ccomm.resume()
+
+    def start_profile(self, project_file, validate=True):
+        """Upload and run a profile
+        :param validate: check_profile first, raise before anything is sent
+        """
+        # Parsed once (or taken from the profile cache), validated and uploaded
+        packets = self.ccomm.compile_profile_file(project_file)
+        if validate:
+            self.check_profile(project_file, packets)
+
         self.toggle_light(2)
 
         download_state = self.get_register('EZT570I_OFFLINE_DOWNLOAD_PROFILE')
         self.log.info("EZT570I_OFFLINE_DOWNLOAD_PROFILE:{}".format(download_state))
 
-        # Read the file and load into chamber
-        self.ccomm.load_profile(project_file)
+        # Load into chamber
+        self.ccomm.write_profile_to_modbus(packets)
 
         retry = 10
         while retry:
@@ -168,24 +502,16 @@ class Chamber(object):
             REFRIGERATION_ALARM_STATUS
             SYSTEM_STATUS_MONITOR
         """
-        #alarm_names [
-        #   'EZT570I_ALARM_STATUS'
-        #   'INPUT_ALARM_STATUS'
-        #   'CHAMBER_ALARM_STATUS'
-        #   'REFRIGERATION_ALARM_STATUS'
-        #   'SYSTEM_STATUS_MONITOR'
-        #]      
-        #start_reg = chamber_commands.name_to_reg('EZT570I_ALARM_STATUS')
-        #values = self.ccomm.read_registers(start_reg, 5)
-        #self.log.debug("Modbus Response:{}".format(values))
+        start_reg = chamber_state.ALARM_START
+        values = self.ccomm.read_registers(start_reg, chamber_state.ALARM_QUANTITY)
+        self.log.debug("Modbus Response:{}".format(values))
 
         alarms_read = {}
-        alarms_read['ezt570i']  = self.get_register('EZT570I_ALARM_STATUS')
-        alarms_read['input']  = self.get_register('INPUT_ALARM_STATUS')
-        alarms_read['chamber']  = self.get_register('CHAMBER_ALARM_STATUS')
-        alarms_read['refrig']  = self.get_register('REFRIGERATION_ALARM_STATUS')
-        alarms_read['system']  = self.get_register('SYSTEM_STATUS_MONITOR')
-         
+        for offset, name in enumerate(chamber_state.AlarmsView.fields):
+            alarms_read[name] = chamber_commands.cached_decode_read_value(
+                start_reg + offset, values.data[offset]
+            )
+
         self.log.debug("alarms:{}".format(alarms_read))
         return alarms_read
 
@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Profile files saved by the chamber touch screen (copied off the CompactFlash)
+
+Each line is one block of the profile area: the header (registers 200-214)
+then up to 99 steps of 15 registers. Two layouts exist:
+    GALAXY:  newer chambers, 17 columns, the last 2 always 0
+    GALILEO: older chambers, 15 columns
+
+ProfileReader streams a file through the csv module, detects the layout from
+the header line and yields each step only when asked, validated, with the line
+and column of anything wrong.
+
+Profile holds the header and steps in one flat array('h'), 15 registers per
+block, with views that decode fields only when touched.
+
+    profile = chamber_profile.read_profile('GALAXY.txt')
+    profile.name                        # 'GALAXY'
+    profile.steps[0].target_setpoint_for_loop_1
+    profile[2:5]                        # steps 3-5 as a new Profile
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import array
+import csv
+import fnmatch
+import multiprocessing
+import os
+import sys
+
+# registers per profile block (header or step)
+BLOCK_SIZE = 15
+MAX_STEPS = 99
+# header column holding the number of steps in the profile
+HEADER_STEPS = 9
+# first register of the profile area, the header
+PROFILE_START = 200
+
+# column count => layout name
+LAYOUTS = {
+    17: 'GALAXY',
+    15: 'GALILEO',
+}
+LAYOUT_COLUMNS = dict((layout, columns) for columns, layout in LAYOUTS.iteritems())
+
+# Touch screen files always hold MAX_STEPS step lines, the ones past the header's
+# step count are unused. Both sample files give an unused step jump step 1.
+UNUSED_STEP = (0, 0, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0, 0, 0, 0)
+
+# columns holding setpoints in tenths, written as floats ("-5.0" is -50)
+HEADER_TENTHS = frozenset(range(10, 15))
+STEP_TENTHS = frozenset([7] + range(10, 15))
+
+
+class ProfileParseError(ValueError):
+    """A profile file that can't be loaded, with where it went wrong"""
+
+    def __init__(self, message, name=None, line=None, column=None):
+        super(ProfileParseError, self).__init__(message, name, line, column)
+        self.message = message
+        self.name = name
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        where = ":".join(
+            str(part) for part in (self.name, self.line, self.column) if part is not None
+        )
+        return "{}: {}".format(where, self.message) if where else self.message
+
+
+def parse_value(text):
+    """Register value from a profile column
+    Floats are setpoints in tenths, so multiply by 10
+    :raise: ValueError
+    """
+    try:
+        return int(text)
+    except ValueError:
+        return int(float(text) * 10)
+
+
+class ProfileReader(object):
+    """Stream the header and steps of a profile file"""
+
+    def __init__(self, fh, name=None):
+        """
+        :param fh: open profile file, or any iterable of lines
+        :param name: file name used in error messages
+        :raise: ProfileParseError when the header is missing or invalid
+        """
+        self.name = name if name is not None else getattr(fh, 'name', None)
+        self.line = 0
+        self._rows = csv.reader(fh)
+        row = self._next_row()
+        if row is None:
+            raise ProfileParseError("empty file, no header", self.name, 1)
+        self.columns = len(row)
+        self.layout = LAYOUTS.get(self.columns)
+        if self.layout is None:
+            raise ProfileParseError(
+                "{} columns, expected {}".format(
+                    self.columns, " or ".join(str(c) for c in sorted(LAYOUTS))
+                ),
+                self.name, self.line
+            )
+        self.header = self._values(row)
+        self.steps_total = self.header[HEADER_STEPS]
+        if not 1 <= self.steps_total <= MAX_STEPS:
+            raise ProfileParseError(
+                "header says {} steps, expected 1-{}".format(self.steps_total, MAX_STEPS),
+                self.name, self.line, HEADER_STEPS + 1
+            )
+
+    def _next_row(self):
+        """Next non blank row, None at the end of the file"""
+        for row in self._rows:
+            self.line += 1
+            if row and any(cell.strip() for cell in row):
+                return row
+        return None
+
+    def _values(self, row):
+        """Validated 15 register values of one line"""
+        if len(row) != self.columns:
+            raise ProfileParseError(
+                "{} columns, {} layout has {}".format(len(row), self.layout, self.columns),
+                self.name, self.line
+            )
+        values = []
+        for column, text in enumerate(row, 1):
+            try:
+                value = parse_value(text.strip())
+            except ValueError:
+                raise ProfileParseError(
+                    "not a number: {!r}".format(text), self.name, self.line, column
+                )
+            if not -0x8000 <= value <= 0x7FFF:
+                raise ProfileParseError(
+                    "{} does not fit a 16 bit register".format(text),
+                    self.name, self.line, column
+                )
+            if column > BLOCK_SIZE:
+                if value:
+                    raise ProfileParseError(
+                        "unused {} column is {}, expected 0".format(self.layout, text),
+                        self.name, self.line, column
+                    )
+                continue
+            values.append(value)
+        return values
+
+    def __iter__(self):
+        """Yield each step as a list of 15 int, the header's step count of them"""
+        for step in xrange(1, self.steps_total + 1):
+            row = self._next_row()
+            if row is None:
+                raise ProfileParseError(
+                    "file ends after step {}, header says {} steps".format(
+                        step - 1, self.steps_total
+                    ),
+                    self.name, self.line
+                )
+            yield self._values(row)
+
+    def unused_steps(self):
+        """Yield the lines after the steps as lists of 15 int, once the steps are read
+        The touch screen writes MAX_STEPS step lines, these are the unused ones.
+        """
+        while True:
+            row = self._next_row()
+            if row is None:
+                return
+            yield self._values(row)
+
+    def read(self):
+        """:return: (header, list of steps)"""
+        return self.header, list(self)
+
+    def profile(self):
+        """Read the remaining steps into a Profile"""
+        registers = array.array('h', self.header)
+        for step in self:
+            registers.extend(step)
+        return Profile(registers, self.layout)
+
+
+def read_profile(path):
+    """Parse one profile file
+    :return: Profile
+    :raise: ProfileParseError
+    """
+    with open(path, 'rb') as fh:
+        return ProfileReader(fh, path).profile()
+
+
+def format_line(values, tenths, layout):
+    """One profile file line, setpoint columns as floats like the touch screen"""
+    columns = [
+        '{:.1f}'.format(value / 10.0) if column in tenths else str(value)
+        for column, value in enumerate(values)
+    ]
+    columns.extend(['0'] * (LAYOUT_COLUMNS[layout] - BLOCK_SIZE))
+    return ','.join(columns)
+
+
+def format_profile(profile, layout=None):
+    """Yield the lines of a profile file, without line endings
+    Like the touch screen, always 1 + MAX_STEPS lines, unused steps are UNUSED_STEP.
+    :param layout: 'GALAXY' or 'GALILEO', default the profile's own or GALAXY
+    """
+    layout = layout or profile.layout or 'GALAXY'
+    if layout not in LAYOUT_COLUMNS:
+        raise ValueError("unknown profile layout {}".format(layout))
+    yield format_line(profile.block(0), HEADER_TENTHS, layout)
+    for index in xrange(1, profile.blocks):
+        yield format_line(profile.block(index), STEP_TENTHS, layout)
+    unused = format_line(UNUSED_STEP, STEP_TENTHS, layout)
+    for _ in xrange(profile.blocks, 1 + MAX_STEPS):
+        yield unused
+
+
+def write_profile(profile, path, layout=None):
+    """Save a Profile in the touch screen file format, readable by read_profile"""
+    with open(path, 'wb') as fh:
+        for line in format_profile(profile, layout):
+            fh.write(line)
+            fh.write('\n')
+
+
+def _read_profile_or_error(path):
+    """Pool worker: result or the error, so one bad file doesn't stop the rest"""
+    try:
+        return path, read_profile(path)
+    except (ProfileParseError, IOError) as e:
+        return path, e
+
+
+def read_profile_directory(directory, pattern='*.txt', processes=1):
+    """Parse every profile file in a directory
+    :param pattern: fnmatch pattern of profile file names
+    :param processes: worker processes, more than 1 parses files in parallel
+    :return: (dict of path => Profile, dict of path => error)
+    """
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if fnmatch.fnmatch(name, pattern)
+    )
+    if processes > 1 and len(paths) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_read_profile_or_error, paths, chunksize=16)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_read_profile_or_error(path) for path in paths]
+
+    profiles = {}
+    errors = {}
+    for path, result in results:
+        if isinstance(result, Exception):
+            errors[path] = result
+        else:
+            profiles[path] = result
+    return profiles, errors
+
+
+def _block_field(offset):
+    """Property returning the register at offset within a block view"""
+
+    def getter(self):
+        return self.registers[self.index + offset]
+
+    return property(getter)
+
+
+class BlockView(object):
+    """Read only window onto one 15 register block of a Profile"""
+    __slots__ = ('registers', 'index', 'number')
+
+    fields = ()
+
+    def __init__(self, registers, index, number):
+        """
+        :param registers: Profile.registers
+        :param index: position of the block in registers
+        :param number: 0 for the header, step number for steps
+        """
+        self.registers = registers
+        self.index = index
+        self.number = number
+
+    @property
+    def reg(self):
+        """First chamber register of the block"""
+        return PROFILE_START + BLOCK_SIZE * self.number
+
+    def values(self):
+        return self.registers[self.index:self.index + BLOCK_SIZE]
+
+    def as_dict(self):
+        return dict(zip(self.fields, self.values()))
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.values() == other.values()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "{}({}, {})".format(type(self).__name__, self.number, self.values().tolist())
+
+
+class HeaderView(BlockView):
+    """Registers 200-214"""
+    __slots__ = ()
+
+    fields = (
+        'autostart',
+        'autostart_time_yy_mm',
+        'autostart_time_day_dow',
+        'autostart_time_hh_mm',
+        'profile_name_ch_1_2',
+        'profile_name_ch_3_4',
+        'profile_name_ch_5_6',
+        'profile_name_ch_7_8',
+        'profile_name_ch_9_10',
+        'total_number_of_steps_in_profile',
+        'guaranteed_soak_band_loop_1',
+        'guaranteed_soak_band_loop_2',
+        'guaranteed_soak_band_loop_3',
+        'guaranteed_soak_band_loop_4',
+        'guaranteed_soak_band_loop_5',
+    )
+
+    @property
+    def name(self):
+        """Profile name, 2 characters per register, low byte first"""
+        chars = []
+        for value in self.registers[self.index + 4:self.index + 9]:
+            chars.append(chr(value & 0xFF))
+            chars.append(chr((value >> 8) & 0xFF))
+        return ''.join(chars).rstrip(' \0')
+
+
+class StepView(BlockView):
+    """Registers 200 + 15 * step number onward"""
+    __slots__ = ()
+
+    fields = (
+        'time_hours',
+        'time_mm_ss',
+        'chamber_events',
+        'customer_events',
+        'guaranteed',
+        'wait_for_loop_events',
+        'wait_for_monitor_events',
+        'wait_for_setpoint',
+        'jump_step_number',
+        'jump_count',
+        'target_setpoint_for_loop_1',
+        'target_setpoint_for_loop_2',
+        'target_setpoint_for_loop_3',
+        'target_setpoint_for_loop_4',
+        'target_setpoint_for_loop_5',
+    )
+
+    @property
+    def duration(self):
+        """Step time in seconds, hours register + MM:SS register (MM high byte)"""
+        mm_ss = self.registers[self.index + 1] & 0xFFFF
+        return self.registers[self.index] * 3600 + (mm_ss >> 8) * 60 + (mm_ss & 0xFF)
+
+
+for _cls in (HeaderView, StepView):
+    for _offset, _name in enumerate(_cls.fields):
+        setattr(_cls, _name, _block_field(_offset))
+del _cls, _offset, _name
+
+
+class ProfileSteps(object):
+    """Sequence of StepView over a Profile, step 1 at index 0"""
+    __slots__ = ('profile',)
+
+    def __init__(self, profile):
+        self.profile = profile
+
+    def __len__(self):
+        return len(self.profile.registers) // BLOCK_SIZE - 1
+
+    def __getitem__(self, index):
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("step index {} out of range".format(index))
+        return StepView(self.profile.registers, BLOCK_SIZE * (index + 1), index + 1)
+
+    def __iter__(self):
+        registers = self.profile.registers
+        for number in xrange(1, len(self) + 1):
+            yield StepView(registers, BLOCK_SIZE * number, number)
+
+
+class Profile(object):
+    """Header plus steps in one flat array('h'), 15 registers per block.
+    Treat it as immutable: it hashes by content, for use as a cache key.
+    """
+    __slots__ = ('registers', 'layout', '_hash', '_wire')
+
+    def __init__(self, registers, layout=None):
+        """
+        :param registers: array('h'), header then steps, a multiple of 15 long
+        :param layout: 'GALAXY' or 'GALILEO' when read from a file
+        """
+        if not isinstance(registers, array.array) or registers.typecode != 'h':
+            registers = array.array('h', registers)
+        if not registers or len(registers) % BLOCK_SIZE:
+            raise ValueError(
+                "{} registers is not header + whole steps".format(len(registers))
+            )
+        self.registers = registers
+        self.layout = layout
+        self._hash = None
+        self._wire = None
+
+    @classmethod
+    def from_blocks(cls, header, steps, layout=None):
+        """Profile from a header list and a list of step lists"""
+        registers = array.array('h', header)
+        for step in steps:
+            registers.extend(step)
+        return cls(registers, layout)
+
+    @property
+    def header(self):
+        return HeaderView(self.registers, 0, 0)
+
+    @property
+    def steps(self):
+        return ProfileSteps(self)
+
+    @property
+    def name(self):
+        return self.header.name
+
+    def __len__(self):
+        """Number of steps"""
+        return len(self.registers) // BLOCK_SIZE - 1
+
+    @property
+    def blocks(self):
+        """Header and steps, as written to the chamber"""
+        return len(self.registers) // BLOCK_SIZE
+
+    def block(self, index):
+        """array('h') of one block, 0 is the header"""
+        return self.registers[BLOCK_SIZE * index:BLOCK_SIZE * (index + 1)]
+
+    def __getitem__(self, index):
+        """profile[n] is StepView of step n + 1, profile[a:b] a new Profile of those steps
+        A slice keeps the header, with the step count set to the new length.
+        Jump step numbers are not renumbered.
+        """
+        if isinstance(index, slice):
+            start, stop, stride = index.indices(len(self))
+            if stride != 1:
+                raise ValueError("profile slices must be contiguous")
+            stop = max(start, stop)
+            registers = self.registers[:BLOCK_SIZE]
+            registers[HEADER_STEPS] = stop - start
+            registers.extend(
+                self.registers[BLOCK_SIZE * (start + 1):BLOCK_SIZE * (stop + 1)]
+            )
+            return Profile(registers, self.layout)
+        return self.steps[index]
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __eq__(self, other):
+        return isinstance(other, Profile) and self.registers == other.registers
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash(self.registers.tostring())
+        return self._hash
+
+    def __getstate__(self):
+        return self.registers, self.layout
+
+    def __setstate__(self, state):
+        self.registers, self.layout = state
+        self._hash = None
+        self._wire = None
+
+    def wire(self):
+        """Big endian copy of the registers, built once, as sent by FC16"""
+        if self._wire is None:
+            wire = array.array('h', self.registers)
+            if sys.byteorder == 'little':
+                wire.byteswap()
+            self._wire = wire
+        return self._wire
+
+    def payload(self, index):
+        """FC16 data bytes of block index (0 is the header), no copy
+        :return: buffer into wire()
+        """
+        size = 2 * BLOCK_SIZE
+        return buffer(self.wire(), size * index, size)
+
+    def __repr__(self):
+        return "Profile({!r}, {} steps, {})".format(self.name, len(self), self.layout)
@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Lazy views over blocks of raw chamber registers
+
+A Snapshot holds the raw control area (registers 0-180) from one poll.
+Nothing is decoded until an attribute is touched, so one snapshot per tick
+can be shared by every consumer.
+
+    snap = chamber.snapshot()
+    snap.loop[0].process_value      # 24.5
+    snap.alarms.chamber             # BitView(0x0200, ('Door Open',))
+    snap.human('OPERATIONAL_MODE')  # 'on'
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import time
+import array
+
+import chamber_commands
+
+# Registers 0 - 180
+CONTROL_AREA_START = 0
+CONTROL_AREA_QUANTITY = chamber_commands.ctrl_register_count
+
+# Loop 1 is 60-71, Loop 2 is 72-83 ... Loop 5 is 108-119
+LOOP_START = chamber_commands.ctrl_registers['LOOP_1_SETPOINT']
+LOOP_STRIDE = 12
+LOOP_COUNT = 5
+
+# Monitor Input 1 is 120-126 ... Monitor Input 8 is 169-175
+MONITOR_INPUT_START = chamber_commands.ctrl_registers['MONITOR_INPUT_1_PROCESS_VALUE']
+MONITOR_INPUT_STRIDE = 7
+MONITOR_INPUT_COUNT = 8
+
+# EZT570I_ALARM_STATUS ... SYSTEM_STATUS_MONITOR, 55-59
+ALARM_START = chamber_commands.ctrl_registers['EZT570I_ALARM_STATUS']
+ALARM_QUANTITY = 5
+
+
+def _field(offset):
+    """Property returning the scaled value (analog) or code (everything else)
+    of the register at offset from the start of the view"""
+
+    def getter(self):
+        return self.value(offset)
+
+    return property(getter)
+
+
+class RegisterView(object):
+    """Window onto a raw int16 register array, decoded on access"""
+    __slots__ = ('raw', 'index', 'start_reg')
+
+    # field names in register order, filled in by subclasses
+    fields = ()
+    # fields the chamber only reports, never written
+    read_only = ()
+
+    def __init__(self, raw, index, start_reg):
+        """
+        :param raw: array('h') (or any indexable) of raw register values
+        :param index: position of start_reg within raw
+        :param start_reg: first register of the view
+        """
+        self.raw = raw
+        self.index = index
+        self.start_reg = start_reg
+
+    def code(self, offset):
+        """Untouched int16 register value"""
+        return int(self.raw[self.index + offset])
+
+    def value(self, offset):
+        """Engineering units for analog registers, code for the rest"""
+        return chamber_commands.scaled_value(
+            self.start_reg + offset, self.raw[self.index + offset]
+        )
+
+    def human(self, field):
+        """Human readable decode of a field, shared through the decode cache"""
+        offset = self.fields.index(field)
+        return chamber_commands.cached_decode_read_value(
+            self.start_reg + offset, self.code(offset)
+        )
+
+    def as_dict(self):
+        return dict(
+            (field, self.value(offset)) for offset, field in enumerate(self.fields)
+        )
+
+    def codes(self):
+        """Raw values of the view, in register order"""
+        return [self.code(offset) for offset in range(len(self.fields))]
+
+
+class LoopView(RegisterView):
+    """One control loop, 12 registers"""
+    __slots__ = ('number',)
+
+    fields = (
+        'setpoint',
+        'process_value',
+        'percent_output',
+        'autotune_status',
+        'upper_setpoint_limit',
+        'lower_setpoint_limit',
+        'alarm_type',
+        'alarm_mode',
+        'alarm_output_assignment',
+        'high_alarm_setpoint',
+        'low_alarm_setpoint',
+        'alarm_hysteresis',
+    )
+
+    read_only = (
+        'process_value',
+        'percent_output',
+    )
+
+    setpoint = _field(0)
+    process_value = _field(1)
+    percent_output = _field(2)
+    autotune_status = _field(3)
+    upper_setpoint_limit = _field(4)
+    lower_setpoint_limit = _field(5)
+    alarm_type = _field(6)
+    alarm_mode = _field(7)
+    alarm_output_assignment = _field(8)
+    high_alarm_setpoint = _field(9)
+    low_alarm_setpoint = _field(10)
+    alarm_hysteresis = _field(11)
+
+    def __init__(self, raw, index, number):
+        super(LoopView, self).__init__(
+            raw, index, LOOP_START + LOOP_STRIDE * (number - 1)
+        )
+        self.number = number
+
+    def __repr__(self):
+        return "LoopView({}, sp:{}, pv:{})".format(
+            self.number, self.setpoint, self.process_value
+        )
+
+
+class MonitorInputView(RegisterView):
+    """One monitor input, 7 registers"""
+    __slots__ = ('number',)
+
+    fields = (
+        'process_value',
+        'alarm_type',
+        'alarm_mode',
+        'alarm_output_assignment',
+        'high_alarm_setpoint',
+        'low_alarm_setpoint',
+        'alarm_hysteresis',
+    )
+
+    read_only = (
+        'process_value',
+    )
+
+    process_value = _field(0)
+    alarm_type = _field(1)
+    alarm_mode = _field(2)
+    alarm_output_assignment = _field(3)
+    high_alarm_setpoint = _field(4)
+    low_alarm_setpoint = _field(5)
+    alarm_hysteresis = _field(6)
+
+    def __init__(self, raw, index, number):
+        super(MonitorInputView, self).__init__(
+            raw, index, MONITOR_INPUT_START + MONITOR_INPUT_STRIDE * (number - 1)
+        )
+        self.number = number
+
+    def __repr__(self):
+        return "MonitorInputView({}, pv:{})".format(self.number, self.process_value)
+
+
+def _alarm(offset):
+    """Property returning a lazy BitView of the alarm register at offset"""
+    flags = chamber_commands.ctrl_register_bitflags[ALARM_START + offset]
+
+    def getter(self):
+        return flags.view(self.code(offset))
+
+    return property(getter)
+
+
+class AlarmsView(RegisterView):
+    """The 5 alarm registers, 55-59, as lazy BitViews.
+    Names match the keys of Chamber.alarms
+    """
+    __slots__ = ()
+
+    fields = (
+        'ezt570i',
+        'input',
+        'chamber',
+        'refrig',
+        'system',
+    )
+
+    ezt570i = _alarm(0)
+    input = _alarm(1)
+    chamber = _alarm(2)
+    refrig = _alarm(3)
+    system = _alarm(4)
+
+    def __init__(self, raw, index):
+        super(AlarmsView, self).__init__(raw, index, ALARM_START)
+
+    def masks(self):
+        return tuple(self.codes())
+
+    def __nonzero__(self):
+        return any(self.codes())
+
+    __bool__ = __nonzero__
+
+    def __repr__(self):
+        return "AlarmsView({})".format(
+            ", ".join("{}:0x{:04X}".format(f, m & 0xFFFF) for f, m in zip(self.fields, self.codes()))
+        )
+
+
+def loop_span(loops=None):
+    """Smallest contiguous register span holding the given loops
+    :param loops: iterable of loop numbers 1-5, default all five
+    :return: (sorted loop numbers, start register, quantity)
+    """
+    loops = sorted(set(loops or range(1, LOOP_COUNT + 1)))
+    if not 1 <= loops[0] <= loops[-1] <= LOOP_COUNT:
+        raise ValueError("loops must be 1-{}: {}".format(LOOP_COUNT, loops))
+    start_reg = LOOP_START + LOOP_STRIDE * (loops[0] - 1)
+    quantity = LOOP_STRIDE * (loops[-1] - loops[0] + 1)
+    return loops, start_reg, quantity
+
+
+def loop_views(raw, loops):
+    """LoopViews onto a raw block read from loop_span(loops)"""
+    return [
+        LoopView(raw, LOOP_STRIDE * (number - loops[0]), number)
+        for number in loops
+    ]
+
+
+def monitor_input_span(inputs=None, process_values_only=False):
+    """Smallest contiguous register span holding the given monitor inputs
+    :param inputs: iterable of input numbers 1-8, default all eight
+    :param process_values_only: stop at the last process value, skip its alarm settings
+    :return: (sorted input numbers, start register, quantity)
+    """
+    inputs = sorted(set(inputs or range(1, MONITOR_INPUT_COUNT + 1)))
+    if not 1 <= inputs[0] <= inputs[-1] <= MONITOR_INPUT_COUNT:
+        raise ValueError("monitor inputs must be 1-{}: {}".format(MONITOR_INPUT_COUNT, inputs))
+    start_reg = MONITOR_INPUT_START + MONITOR_INPUT_STRIDE * (inputs[0] - 1)
+    quantity = MONITOR_INPUT_STRIDE * (inputs[-1] - inputs[0])
+    if process_values_only:
+        quantity += 1
+    else:
+        quantity += MONITOR_INPUT_STRIDE
+    return inputs, start_reg, quantity
+
+
+class MonitorInputBlock(object):
+    """Monitor inputs from one read as compact columns, one entry per input.
+    Analog columns are array('d') in engineering units, enum columns array('h') codes.
+    """
+    __slots__ = (
+        'numbers',
+        'timestamp',
+        'process_value',
+        'alarm_type',
+        'alarm_mode',
+        'alarm_output_assignment',
+        'high_alarm_setpoint',
+        'low_alarm_setpoint',
+        'alarm_hysteresis',
+        '_raw',
+    )
+
+    def __init__(self, raw, inputs, timestamp=None):
+        """
+        :param raw: array('h') read from monitor_input_span(inputs)
+        :param inputs: sorted input numbers
+        """
+        self.numbers = tuple(inputs)
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._raw = raw
+        indexes = [MONITOR_INPUT_STRIDE * (number - inputs[0]) for number in inputs]
+        for offset, field in enumerate(MonitorInputView.fields):
+            reg = MONITOR_INPUT_START + offset
+            divisor = chamber_commands.ctrl_register_divisors[reg]
+            if divisor == divisor:
+                column = array.array('d', [raw[i + offset] / divisor for i in indexes])
+            else:
+                column = array.array('h', [raw[i + offset] for i in indexes])
+            setattr(self, field, column)
+
+    def __len__(self):
+        return len(self.numbers)
+
+    def views(self):
+        """MonitorInputView per input"""
+        return [
+            MonitorInputView(self._raw, MONITOR_INPUT_STRIDE * (number - self.numbers[0]), number)
+            for number in self.numbers
+        ]
+
+    def __repr__(self):
+        return "MonitorInputBlock({}, pv:{})".format(
+            list(self.numbers), list(self.process_value)
+        )
+
+
+def monitor_process_values(raw, inputs):
+    """array('d') of process values from a monitor_input_span(inputs, True) read"""
+    return array.array('d', [
+        chamber_commands.scaled_value(
+            MONITOR_INPUT_START + MONITOR_INPUT_STRIDE * (number - 1),
+            raw[MONITOR_INPUT_STRIDE * (number - inputs[0])]
+        )
+        for number in inputs
+    ])
+
+
+def register_writes(view_class, start_reg, settings):
+    """
+    Registers and codes for field settings, one single register write each.
+    :param view_class: LoopView or MonitorInputView, gives field order
+    :param start_reg: first register of the loop or input
+    :param settings: dict of field => engineering value (or code for enums)
+    :return: list of (register, int16) in register order
+    """
+    writes = []
+    for field, value in settings.items():
+        if field in view_class.read_only:
+            raise ValueError("{} is read only".format(field))
+        register = start_reg + view_class.fields.index(field)
+        writes.append((register, chamber_commands.encode_scaled_value(register, value)))
+    writes.sort()
+    return writes
+
+
+class Snapshot(object):
+    """Raw control area from one poll plus the time it was taken.
+    Views and values are decoded only when touched.
+    """
+    __slots__ = ('raw', 'start_reg', 'timestamp', '_loop', '_monitor', '_alarms')
+
+    def __init__(self, raw, timestamp=None, start_reg=CONTROL_AREA_START):
+        """
+        :param raw: array('h') of registers start_reg onward
+        :param timestamp: time.time() of the read
+        """
+        self.raw = raw
+        self.start_reg = start_reg
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self._loop = None
+        self._monitor = None
+        self._alarms = None
+
+    def _index(self, reg):
+        reg = chamber_commands.ctrl_registers.get(reg, reg)
+        index = reg - self.start_reg
+        if not 0 <= index < len(self.raw):
+            raise IndexError("register {} not in snapshot".format(reg))
+        return index, reg
+
+    def code(self, reg):
+        """Untouched int16 value of a register number or name"""
+        index, reg = self._index(reg)
+        return int(self.raw[index])
+
+    def value(self, reg):
+        """Engineering units for analog registers, code for the rest"""
+        index, reg = self._index(reg)
+        return chamber_commands.scaled_value(reg, self.raw[index])
+
+    __getitem__ = value
+
+    def human(self, reg):
+        """Same result as Chamber.get_register, without the bus round trip"""
+        index, reg = self._index(reg)
+        return chamber_commands.cached_decode_read_value(reg, int(self.raw[index]))
+
+    def block(self):
+        """Every register scaled in one pass, see chamber_commands.decode_register_block"""
+        return chamber_commands.decode_register_block(self.start_reg, self.raw)
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+    @property
+    def loop(self):
+        """LoopView for loops 1-5, loop[0] is loop 1"""
+        if self._loop is None:
+            self._loop = tuple(
+                LoopView(self.raw, LOOP_START + LOOP_STRIDE * i - self.start_reg, i + 1)
+                for i in range(LOOP_COUNT)
+            )
+        return self._loop
+
+    @property
+    def monitor(self):
+        """MonitorInputView for inputs 1-8, monitor[0] is input 1"""
+        if self._monitor is None:
+            self._monitor = tuple(
+                MonitorInputView(
+                    self.raw,
+                    MONITOR_INPUT_START + MONITOR_INPUT_STRIDE * i - self.start_reg,
+                    i + 1
+                )
+                for i in range(MONITOR_INPUT_COUNT)
+            )
+        return self._monitor
+
+    @property
+    def alarms(self):
+        if self._alarms is None:
+            self._alarms = AlarmsView(self.raw, ALARM_START - self.start_reg)
+        return self._alarms
+
+    @property
+    def temperature(self):
+        return self.value('LOOP_1_PROCESS_VALUE')
+
+    @property
+    def light(self):
+        return self.human('CHAMBER_LIGHT_CONTROL')
+
+    @property
+    def profile_control_status(self):
+        return self.human('PROFILE_CONTROL_STATUS')['mode']
+
+    @property
+    def profile_current_step(self):
+        return self.code('PROFILE_CURRENT_STEP')
+
+    def __repr__(self):
+        return "Snapshot(registers {}-{}, {:.3f})".format(
+            self.start_reg, self.start_reg + len(self.raw) - 1, self.timestamp
+        )
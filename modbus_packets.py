@@ -103,7 +103,7 @@ def write_profile_factory(register_count):
     return WriteProfileSend(register_count)
 
 
-class WriteProfileResponse(ctypes.Structure):
+class WriteProfileResponse(ctypes.BigEndianStructure):
     """For Profile Download only, response packet from valid write:
                    nn | nn | nn nn | nn  nn   | nn nn
                   0x01 0x10  |  |   0x00 0x0F   |  |
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+On disk cache of compiled profiles
+
+load_profile parses the CSV, converts every value, packs and CRCs every
+packet. The finished frames only depend on the file content and the chamber
+number, so they are stored under a hash of both. Uploading the same profile
+again, or to the next chamber of the same number, goes straight to the wire.
+An edited file or another chamber number hashes to a different key.
+
+    ccomm.profile_cache = profile_cache.ProfileCache()
+    ccomm.load_profile('GALAXY.txt')
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import ctypes
+import hashlib
+import io
+import os
+import struct
+import tempfile
+import threading
+
+import modbus_packets
+
+# Bump when the packet layout changes, so old entries are never read
+FORMAT_VERSION = 1
+MAGIC = 'EZTP'
+# magic, format version, frame count
+FILE_HEADER = struct.Struct('!4sHH')
+FRAME_LENGTH = struct.Struct('!H')
+# frame: address, command, reg, quantity, dsize ... data ... crc
+FRAME_PREFIX = struct.Struct('!2B2HB')
+
+
+def default_directory():
+    return os.path.join(os.path.expanduser('~'), '.ezt570i', 'profile_cache')
+
+
+def frame_to_packet(frame):
+    """WriteProfileSend from stored frame bytes, no parsing or CRC work"""
+    quantity = FRAME_PREFIX.unpack_from(frame)[3]
+    packet = modbus_packets.write_profile_factory(quantity)
+    ctypes.memmove(ctypes.addressof(packet), frame, len(frame))
+    return packet
+
+
+def packet_to_frame(packet):
+    return ctypes.string_at(ctypes.addressof(packet), ctypes.sizeof(packet))
+
+
+class ProfileCache(object):
+    """Compiled profile frames keyed by file content hash + chamber_number"""
+
+    def __init__(self, directory=None, log=None):
+        """
+        :param directory: where entries live, default ~/.ezt570i/profile_cache
+        """
+        self.directory = directory or default_directory()
+        self.log = log
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key => list of frame bytes, saves the disk read on repeat uploads
+        self._memory = {}
+
+    @staticmethod
+    def key(content, chamber_number):
+        digest = hashlib.sha1(content)
+        digest.update(struct.pack('!HB', FORMAT_VERSION, chamber_number))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.frames')
+
+    def get(self, key):
+        """:return: list of frame bytes, None on a miss"""
+        with self._lock:
+            frames = self._memory.get(key)
+        if frames is not None:
+            return frames
+        try:
+            with open(self.path(key), 'rb') as fh:
+                data = fh.read()
+        except IOError:
+            return None
+        frames = self._unpack(data)
+        if frames is not None:
+            with self._lock:
+                self._memory[key] = frames
+        return frames
+
+    def put(self, key, frames):
+        """Store frames atomically, readers never see a partial entry"""
+        frames = list(frames)
+        with self._lock:
+            self._memory[key] = frames
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        data = [FILE_HEADER.pack(MAGIC, FORMAT_VERSION, len(frames))]
+        for frame in frames:
+            data.append(FRAME_LENGTH.pack(len(frame)))
+            data.append(frame)
+        fd, temp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as fh:
+            fh.write(''.join(data))
+        os.rename(temp_path, self.path(key))
+
+    def _unpack(self, data):
+        if len(data) < FILE_HEADER.size:
+            return None
+        magic, version, count = FILE_HEADER.unpack_from(data)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return None
+        frames = []
+        offset = FILE_HEADER.size
+        for _ in xrange(count):
+            try:
+                length = FRAME_LENGTH.unpack_from(data, offset)[0]
+            except struct.error:
+                # Truncated file, a miss like any other damage
+                return None
+            offset += FRAME_LENGTH.size
+            frames.append(data[offset:offset + length])
+            offset += length
+        if len(frames) != count or offset != len(data):
+            return None
+        return frames
+
+    def load(self, ccomm, project_file):
+        """Packets for project_file, compiled by ccomm only on a miss
+        :param ccomm: chamber_communication.ChamberCommunication
+        :return: list of WriteProfileSend
+        """
+        with open(project_file, 'rb') as fh:
+            content = fh.read()
+        key = self.key(content, ccomm.chamber_number)
+        frames = self.get(key)
+        if frames is not None:
+            self.hits += 1
+            if self.log:
+                self.log.debug("Profile cache hit:{} {}".format(project_file, key))
+            return [frame_to_packet(frame) for frame in frames]
+
+        self.misses += 1
+        packets = ccomm.compile_profile(io.BytesIO(content))
+        self.put(key, [packet_to_frame(packet) for packet in packets])
+        return packets
+
+    def clear(self):
+        """Drop every entry, in memory and on disk"""
+        with self._lock:
+            self._memory.clear()
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.frames'):
+                os.remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._memory)}
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Convert profile files between the GALAXY (17 column) and GALILEO (15 column) layouts
+
+The canonical form of a profile is its registers: the header and steps, 15 per
+block, exactly as written to the chamber. Both layouts map onto it, GALAXY
+only adds 2 columns that are always 0, so a conversion is lossless when the
+registers read back from the new file are the registers read from the old one.
+Every line is carried over, touch screen files have 99 step lines whatever
+the step count, and the checksum covers the unused steps too.
+
+Files are converted line by line, the register checksum (sha1 of the big
+endian registers, the FC16 payload) is taken while writing, then the new file
+is read back and must give the same checksum before it replaces anything.
+
+    results, errors = profile_convert.convert_directory(
+        'galaxy_profiles', 'galileo_profiles', 'GALILEO', processes=4
+    )
+    profile_convert.write_manifest(results, 'galileo_profiles/checksums.csv')
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import argparse
+import array
+import csv
+import fnmatch
+import hashlib
+import itertools
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import chamber_profile
+
+
+class ConversionError(ValueError):
+    """Converted file doesn't read back to the same registers"""
+
+
+class ConversionResult(object):
+    """One converted file"""
+    __slots__ = ('source', 'destination', 'source_layout', 'layout', 'checksum', 'steps')
+
+    def __init__(self, source, destination, source_layout, layout, checksum, steps):
+        """
+        :param checksum: sha1 hex of the big endian registers, same for both files
+        """
+        self.source = source
+        self.destination = destination
+        self.source_layout = source_layout
+        self.layout = layout
+        self.checksum = checksum
+        self.steps = steps
+
+    def __repr__(self):
+        return "ConversionResult({} {} -> {} {}, {})".format(
+            self.source, self.source_layout, self.destination, self.layout, self.checksum
+        )
+
+
+def _update_checksum(digest, values):
+    block = array.array('h', values)
+    if sys.byteorder == 'little':
+        block.byteswap()
+    digest.update(block.tostring())
+
+
+def register_checksum(fh, name=None):
+    """Checksum of every register in a profile file, either layout, unused steps too
+    :return: (layout, sha1 hex, step count)
+    :raise: chamber_profile.ProfileParseError
+    """
+    reader = chamber_profile.ProfileReader(fh, name)
+    digest = hashlib.sha1()
+    _update_checksum(digest, reader.header)
+    for step in itertools.chain(reader, reader.unused_steps()):
+        _update_checksum(digest, step)
+    return reader.layout, digest.hexdigest(), reader.steps_total
+
+
+def convert_stream(source, destination, layout, name=None):
+    """Copy a profile file to another layout, one line at a time, unused steps too
+    :param source: open profile file, or any iterable of lines
+    :param destination: file open for writing
+    :param layout: 'GALAXY' or 'GALILEO'
+    :return: (source layout, sha1 hex of the registers, step count)
+    :raise: chamber_profile.ProfileParseError
+    """
+    if layout not in chamber_profile.LAYOUT_COLUMNS:
+        raise ValueError("unknown profile layout {}".format(layout))
+    reader = chamber_profile.ProfileReader(source, name)
+    digest = hashlib.sha1()
+    _update_checksum(digest, reader.header)
+    destination.write(
+        chamber_profile.format_line(reader.header, chamber_profile.HEADER_TENTHS, layout)
+    )
+    destination.write('\n')
+    for step in itertools.chain(reader, reader.unused_steps()):
+        _update_checksum(digest, step)
+        destination.write(
+            chamber_profile.format_line(step, chamber_profile.STEP_TENTHS, layout)
+        )
+        destination.write('\n')
+    return reader.layout, digest.hexdigest(), reader.steps_total
+
+
+def convert_file(source, destination, layout):
+    """Convert one file, verified by reading it back before it is put in place
+    :param source: path of the profile file
+    :param destination: path to write, may be source to convert in place
+    :return: ConversionResult
+    :raise: chamber_profile.ProfileParseError, ConversionError, IOError
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    try:
+        with open(source, 'rb') as fh, os.fdopen(fd, 'wb') as out:
+            source_layout, checksum, steps = convert_stream(fh, out, layout, source)
+        with open(temp_path, 'rb') as fh:
+            written_layout, written_checksum, _ = register_checksum(fh, destination)
+        if written_layout != layout or written_checksum != checksum:
+            raise ConversionError(
+                "{}: reads back as {} {}, expected {} {}".format(
+                    destination, written_layout, written_checksum, layout, checksum
+                )
+            )
+        # mkstemp files are private, keep the source's permissions
+        os.chmod(temp_path, os.stat(source).st_mode & 0o777)
+        os.rename(temp_path, destination)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return ConversionResult(source, destination, source_layout, layout, checksum, steps)
+
+
+def _convert_or_error(args):
+    """Pool worker: result or the error, so one bad file doesn't stop the rest"""
+    source, destination, layout = args
+    try:
+        return source, convert_file(source, destination, layout)
+    except (chamber_profile.ProfileParseError, ConversionError, IOError, OSError) as e:
+        return source, e
+
+
+def convert_directory(source_directory, destination_directory, layout,
+                      pattern='*.txt', processes=1):
+    """Convert every profile file in a directory, file names are kept
+    :param destination_directory: created if missing, may be source_directory
+    :param pattern: fnmatch pattern of profile file names
+    :param processes: worker processes, more than 1 converts files in parallel
+    :return: (dict of source path => ConversionResult, dict of source path => error)
+    """
+    if layout not in chamber_profile.LAYOUT_COLUMNS:
+        raise ValueError("unknown profile layout {}".format(layout))
+    if not os.path.isdir(destination_directory):
+        os.makedirs(destination_directory)
+    jobs = [
+        (
+            os.path.join(source_directory, name),
+            os.path.join(destination_directory, name),
+            layout
+        )
+        for name in sorted(os.listdir(source_directory))
+        if fnmatch.fnmatch(name, pattern)
+    ]
+    if processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            outcomes = pool.map(_convert_or_error, jobs, chunksize=16)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        outcomes = [_convert_or_error(job) for job in jobs]
+
+    results = {}
+    errors = {}
+    for source, outcome in outcomes:
+        if isinstance(outcome, Exception):
+            errors[source] = outcome
+        else:
+            results[source] = outcome
+    return results, errors
+
+
+def write_manifest(results, path):
+    """CSV of every conversion: source, destination, layouts, steps, register sha1"""
+    with open(path, 'wb') as fh:
+        writer = csv.writer(fh)
+        writer.writerow(
+            ['source', 'source_layout', 'destination', 'layout', 'steps', 'sha1']
+        )
+        for source in sorted(results):
+            result = results[source]
+            writer.writerow([
+                result.source, result.source_layout, result.destination,
+                result.layout, result.steps, result.checksum
+            ])
+
+
+def verify_manifest(path):
+    """Re-read every file in a manifest, both ends must still match its checksum
+    :return: dict of path => problem, empty when everything matches
+    """
+    problems = {}
+    with open(path, 'rb') as fh:
+        for row in csv.DictReader(fh):
+            for key in ('source', 'destination'):
+                file_path = row[key]
+                try:
+                    with open(file_path, 'rb') as profile_fh:
+                        checksum = register_checksum(profile_fh, file_path)[1]
+                except (chamber_profile.ProfileParseError, IOError) as e:
+                    problems[file_path] = str(e)
+                    continue
+                if checksum != row['sha1']:
+                    problems[file_path] = "sha1 {}, manifest has {}".format(
+                        checksum, row['sha1']
+                    )
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a directory of profile files to another layout"
+    )
+    parser.add_argument('source', help="directory of profile files")
+    parser.add_argument('destination', help="directory for the converted files")
+    parser.add_argument('layout', choices=sorted(chamber_profile.LAYOUT_COLUMNS))
+    parser.add_argument('--pattern', default='*.txt')
+    parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--manifest', help="write a checksum CSV here")
+    args = parser.parse_args()
+
+    results, errors = convert_directory(
+        args.source, args.destination, args.layout, args.pattern, args.processes
+    )
+    if args.manifest:
+        write_manifest(results, args.manifest)
+    for source in sorted(errors):
+        print("FAILED {}: {}".format(source, errors[source]))
+    print("{} converted, {} failed".format(len(results), len(errors)))
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
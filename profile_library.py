@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Index of a directory of profile files, queried without re-parsing them
+
+The first refresh() parses every file; the metadata (name, layout, step count,
+loops used, setpoint range per loop, estimated runtime, sha1 of the content)
+is saved to an index file next to the profiles. Later refreshes only stat the
+files, and re-read one only when its mtime or size changed, re-parsing it only
+when its sha1 changed too.
+
+    library = profile_library.ProfileLibrary('/mnt/cf/profiles')
+    library.refresh()
+    for info in library.query(loop=2, below=-40.0):
+        print info.path, info.name, info.duration
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import chamber_profile
+import chamber_state
+import profile_runtime
+import profile_validator
+
+INDEX_NAME = '.profile_index.json'
+# Bump when ProfileInfo fields are added or change meaning, older indexes are rebuilt
+INDEX_VERSION = 2
+
+
+class ProfileInfo(object):
+    """Metadata of one profile file, as kept in the index"""
+    __slots__ = (
+        'path', 'mtime', 'size', 'sha1', 'error',
+        'name', 'layout', 'steps', 'loops',
+        'setpoint_min', 'setpoint_max', 'duration', 'open_ended',
+    )
+
+    def __init__(self, **fields):
+        for field in self.__slots__:
+            setattr(self, field, fields.get(field))
+
+    @classmethod
+    def from_profile(cls, path, mtime, size, sha1, profile):
+        """Metadata of a parsed chamber_profile.Profile"""
+        loops = set()
+        setpoint_min = [None] * chamber_state.LOOP_COUNT
+        setpoint_max = [None] * chamber_state.LOOP_COUNT
+        for step in profile.steps:
+            for loop in range(1, chamber_state.LOOP_COUNT + 1):
+                # a 0 target on a loop the step doesn't use is not a setpoint
+                if not profile_validator.step_uses_loop(step, loop):
+                    continue
+                loops.add(loop)
+                value = getattr(step, 'target_setpoint_for_loop_{}'.format(loop)) / 10.0
+                if setpoint_min[loop - 1] is None or value < setpoint_min[loop - 1]:
+                    setpoint_min[loop - 1] = value
+                if setpoint_max[loop - 1] is None or value > setpoint_max[loop - 1]:
+                    setpoint_max[loop - 1] = value
+        try:
+            estimate = profile_runtime.estimate_runtime(profile)
+        except ValueError:
+            # Jump loops too long to walk, e.g. crossing 999x jumps
+            duration = open_ended = None
+        else:
+            duration, open_ended = estimate.total, estimate.open_ended
+        return cls(
+            path=path, mtime=mtime, size=size, sha1=sha1,
+            name=profile.name, layout=profile.layout, steps=len(profile),
+            loops=sorted(loops),
+            setpoint_min=setpoint_min, setpoint_max=setpoint_max,
+            duration=duration, open_ended=open_ended,
+        )
+
+    def as_dict(self):
+        return dict((field, getattr(self, field)) for field in self.__slots__)
+
+    def setpoint_range(self, loop):
+        """(min, max) target setpoint of a loop over the steps using it,
+        engineering units, (None, None) for a loop the profile doesn't use
+        """
+        return self.setpoint_min[loop - 1], self.setpoint_max[loop - 1]
+
+    def __repr__(self):
+        if self.error:
+            return "ProfileInfo({}, error: {})".format(self.path, self.error)
+        return "ProfileInfo({}, {!r}, {} steps, loops {})".format(
+            self.path, self.name, self.steps, self.loops
+        )
+
+
+class ProfileLibrary(object):
+    """Persistent, incrementally refreshed index of a profile directory"""
+
+    def __init__(self, directory, index_path=None, pattern='*.txt', log=None):
+        """
+        :param directory: directory of profile files
+        :param index_path: where the index is saved, default directory/.profile_index.json
+        :param pattern: fnmatch pattern of profile file names
+        """
+        self.directory = directory
+        self.index_path = index_path or os.path.join(directory, INDEX_NAME)
+        self.pattern = pattern
+        self.log = log
+        # file name => ProfileInfo
+        self.entries = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'rb') as fh:
+                index = json.load(fh)
+        except (IOError, ValueError):
+            return
+        if index.get('version') != INDEX_VERSION:
+            return
+        for name, fields in index['entries'].iteritems():
+            self.entries[name] = ProfileInfo(**fields)
+
+    def save(self):
+        """Write the index atomically"""
+        index = {
+            'version': INDEX_VERSION,
+            'entries': dict(
+                (name, info.as_dict()) for name, info in self.entries.iteritems()
+            ),
+        }
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as fh:
+            json.dump(index, fh, sort_keys=True)
+        os.rename(temp_path, self.index_path)
+
+    def _index_file(self, name, stat, previous):
+        """ProfileInfo for one file, parsing it only when its content changed"""
+        path = os.path.join(self.directory, name)
+        with open(path, 'rb') as fh:
+            content = fh.read()
+        sha1 = hashlib.sha1(content).hexdigest()
+        if previous is not None and previous.sha1 == sha1:
+            previous.mtime = stat.st_mtime
+            previous.size = stat.st_size
+            return previous
+        try:
+            profile = chamber_profile.ProfileReader(io.BytesIO(content), name).profile()
+        except chamber_profile.ProfileParseError as e:
+            return ProfileInfo(
+                path=path, mtime=stat.st_mtime, size=stat.st_size, sha1=sha1, error=str(e)
+            )
+        return ProfileInfo.from_profile(path, stat.st_mtime, stat.st_size, sha1, profile)
+
+    def refresh(self, save=True):
+        """Bring the index up to date with the directory
+        :return: (added, changed, removed) counts
+        """
+        names = set(
+            name for name in os.listdir(self.directory)
+            if fnmatch.fnmatch(name, self.pattern)
+        )
+        added = changed = 0
+        for name in names:
+            stat = os.stat(os.path.join(self.directory, name))
+            previous = self.entries.get(name)
+            if previous is not None and \
+                    previous.mtime == stat.st_mtime and previous.size == stat.st_size:
+                continue
+            info = self._index_file(name, stat, previous)
+            if previous is None:
+                added += 1
+            elif info is not previous:
+                changed += 1
+            self.entries[name] = info
+
+        removed = [name for name in self.entries if name not in names]
+        for name in removed:
+            del self.entries[name]
+
+        if save:
+            self.save()
+        if self.log:
+            self.log.info("Profile library {}: {} added, {} changed, {} removed".format(
+                self.directory, added, changed, len(removed)
+            ))
+        return added, changed, len(removed)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(sorted(self.entries.values(), key=lambda info: info.path))
+
+    @property
+    def errors(self):
+        """ProfileInfo of the files that didn't parse"""
+        return [info for info in self if info.error]
+
+    def query(self, loop=None, below=None, above=None, name=None,
+              max_duration=None, steps=None, predicate=None):
+        """Profiles matching every given condition, answered from the index
+        :param loop: uses this loop
+        :param below: with loop, goes below this setpoint (engineering units)
+        :param above: with loop, goes above this setpoint
+        :param name: fnmatch pattern of the profile name, e.g. 'JESD*'
+        :param max_duration: estimated runtime at most this many seconds, profiles
+            with no estimate (duration None) never match
+        :param steps: exact step count
+        :param predicate: callable(ProfileInfo) for anything else
+        :return: list of ProfileInfo, sorted by path
+        """
+        matches = []
+        for info in self:
+            if info.error:
+                continue
+            if loop is not None:
+                if loop not in info.loops:
+                    continue
+                low, high = info.setpoint_range(loop)
+                if below is not None and not low < below:
+                    continue
+                if above is not None and not high > above:
+                    continue
+            if name is not None and not fnmatch.fnmatch(info.name, name):
+                continue
+            if max_duration is not None and (
+                    info.duration is None or info.duration > max_duration):
+                continue
+            if steps is not None and info.steps != steps:
+                continue
+            if predicate is not None and not predicate(info):
+                continue
+            matches.append(info)
+        return matches
+
+    def load(self, info):
+        """Parse the file behind an index entry
+        :return: chamber_profile.Profile
+        """
+        return chamber_profile.read_profile(info.path)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Render a profile for review, or export it as JSON or CSV
+
+Works straight from a chamber_profile.Profile: one line per step from a
+format template built at import, no ctypes structures, no per field dicts,
+no modbus packets. A 99 step profile is about 100 lines of text.
+
+    print(profile_render.render_profile(profile))
+
+    with open('library.json', 'wb') as fh:
+        profile_render.write_json(profiles, fh)     # any iterable, one at a time
+
+    with open('library.csv', 'wb') as fh:
+        profile_render.write_csv(profiles, fh)
+
+The JSON form is an array of profile objects, written one step at a time, so
+a library of thousands of profiles never has to be in memory at once.
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import csv
+import json
+
+import chamber_commands
+import chamber_state
+import profile_validator
+
+LOOPS = range(1, chamber_state.LOOP_COUNT + 1)
+
+# Step table, built once
+STEP_HEADINGS = (
+    ('Step', 4), ('Reg', 4), ('Time', 11), ('Chamber Ev', 10), ('Customer Ev', 11),
+    ('Soak', 8), ('Wait For', 16), ('Jump', 8),
+) + tuple(('Loop {}'.format(loop), 7) for loop in LOOPS)
+STEP_TEMPLATE = ' '.join(
+    '{{:>{}}}'.format(width) if index < 2 or index >= 8 else '{{:<{}}}'.format(width)
+    for index, (_, width) in enumerate(STEP_HEADINGS)
+)
+STEP_TITLE = STEP_TEMPLATE.format(*(heading for heading, _ in STEP_HEADINGS))
+STEP_RULE = '-' * len(STEP_TITLE)
+
+HEADER_TEMPLATE = (
+    "Profile: {name}\n"
+    "Steps: {steps}  Autostart: {autostart}\n"
+    "Guaranteed soak band: {soak_bands}"
+)
+
+# Columns of write_csv, and the keys of each step in the JSON form
+RECORD_FIELDS = (
+    'step', 'reg', 'duration', 'time_hours', 'time_minutes', 'time_seconds',
+    'chamber_events', 'customer_events', 'guaranteed_soak_loops',
+    'wait_for_digital_inputs', 'wait_for_loops', 'wait_for_monitor_inputs',
+    'wait_for_setpoint', 'jump_step_number', 'jump_count',
+) + tuple('target_setpoint_for_loop_{}'.format(loop) for loop in LOOPS)
+CSV_FIELDS = ('profile',) + RECORD_FIELDS
+
+# mask => "1,3", the same few masks repeat on every step
+_bit_text_cache = {}
+
+
+def _bit_numbers(mask):
+    """1 based numbers of the bits set in mask"""
+    return [bit + 1 for bit in range(16) if mask & (1 << bit)]
+
+
+def _bit_text(mask):
+    mask &= 0xFFFF
+    text = _bit_text_cache.get(mask)
+    if text is None:
+        text = ','.join(str(bit) for bit in _bit_numbers(mask)) or '-'
+        _bit_text_cache[mask] = text
+    return text
+
+
+def _wait_text(step):
+    """The step's "wait for", there is at most one"""
+    inputs = (step.guaranteed & profile_validator.DIGITAL_INPUT_WAIT_BITS) >> 5
+    if inputs:
+        return 'DI {}'.format(_bit_text(inputs))
+    if step.wait_for_loop_events:
+        return 'L{} @ {:.1f}'.format(
+            _bit_text(step.wait_for_loop_events), step.wait_for_setpoint / 10.0
+        )
+    if step.wait_for_monitor_events:
+        return 'Mon {}'.format(_bit_text(step.wait_for_monitor_events))
+    return '-'
+
+
+def render_header(profile):
+    header = profile.header
+    return HEADER_TEMPLATE.format(
+        name=header.name,
+        steps=header.total_number_of_steps_in_profile,
+        autostart=chamber_commands.get_autostart(header.autostart),
+        soak_bands=' '.join(
+            '{:.1f}'.format(value / 10.0) for value in header.values()[10:]
+        ),
+    )
+
+
+def render_step(step):
+    """One line of the step table"""
+    mm_ss = step.time_mm_ss & 0xFFFF
+    if step.jump_count:
+        jump = '{}x{}'.format(step.jump_step_number, step.jump_count)
+    else:
+        jump = '-'
+    return STEP_TEMPLATE.format(
+        step.number,
+        step.reg,
+        '{}:{:02d}:{:02d}'.format(step.time_hours, mm_ss >> 8, mm_ss & 0xFF),
+        _bit_text(step.chamber_events),
+        _bit_text(step.customer_events),
+        _bit_text(step.guaranteed & profile_validator.GUARANTEED_SOAK_BITS),
+        _wait_text(step),
+        jump,
+        *['{:.1f}'.format(value / 10.0) for value in step.values()[10:]]
+    )
+
+
+def render_lines(profile):
+    """Yield the lines of render_profile"""
+    yield render_header(profile)
+    yield STEP_TITLE
+    yield STEP_RULE
+    for step in profile.steps:
+        yield render_step(step)
+
+
+def render_profile(profile):
+    """Header plus a step table, as one string"""
+    return '\n'.join(render_lines(profile))
+
+
+def step_record(step):
+    """Decoded step, keys RECORD_FIELDS, setpoints in engineering units"""
+    mm_ss = step.time_mm_ss & 0xFFFF
+    values = step.values()
+    record = {
+        'step': step.number,
+        'reg': step.reg,
+        'duration': step.duration,
+        'time_hours': step.time_hours,
+        'time_minutes': mm_ss >> 8,
+        'time_seconds': mm_ss & 0xFF,
+        'chamber_events': _bit_numbers(step.chamber_events),
+        'customer_events': _bit_numbers(step.customer_events),
+        'guaranteed_soak_loops': _bit_numbers(
+            step.guaranteed & profile_validator.GUARANTEED_SOAK_BITS
+        ),
+        'wait_for_digital_inputs': _bit_numbers(
+            (step.guaranteed & profile_validator.DIGITAL_INPUT_WAIT_BITS) >> 5
+        ),
+        'wait_for_loops': _bit_numbers(step.wait_for_loop_events),
+        'wait_for_monitor_inputs': _bit_numbers(step.wait_for_monitor_events),
+        'wait_for_setpoint': step.wait_for_setpoint / 10.0,
+        'jump_step_number': step.jump_step_number,
+        'jump_count': step.jump_count,
+    }
+    for loop in LOOPS:
+        record['target_setpoint_for_loop_{}'.format(loop)] = values[9 + loop] / 10.0
+    return record
+
+
+def header_record(profile):
+    header = profile.header
+    return {
+        'name': header.name,
+        'layout': profile.layout,
+        'steps': header.total_number_of_steps_in_profile,
+        'autostart': header.autostart,
+        'autostart_time_yy_mm': header.autostart_time_yy_mm,
+        'autostart_time_day_dow': header.autostart_time_day_dow,
+        'autostart_time_hh_mm': header.autostart_time_hh_mm,
+        'guaranteed_soak_band': [value / 10.0 for value in header.values()[10:]],
+    }
+
+
+def iter_json(profiles):
+    """Yield a JSON array of profiles in small pieces, one step at a time
+    :param profiles: iterable of chamber_profile.Profile, read lazily
+    """
+    yield '['
+    for number, profile in enumerate(profiles):
+        if number:
+            yield ','
+        # header fields, then the step list filled in below
+        head = json.dumps(header_record(profile), sort_keys=True)
+        yield head[:-1]
+        yield ', "step_list": ['
+        for index, step in enumerate(profile.steps):
+            if index:
+                yield ','
+            yield json.dumps(step_record(step), sort_keys=True)
+        yield ']}'
+    yield ']'
+
+
+def write_json(profiles, fh):
+    """Stream iter_json to an open file"""
+    for chunk in iter_json(profiles):
+        fh.write(chunk)
+
+
+def write_csv(profiles, fh):
+    """One row per step, CSV_FIELDS columns, bit lists as "1,3" """
+    writer = csv.writer(fh)
+    writer.writerow(CSV_FIELDS)
+    for profile in profiles:
+        name = profile.name
+        for step in profile.steps:
+            record = step_record(step)
+            row = [name]
+            for field in RECORD_FIELDS:
+                value = record[field]
+                if isinstance(value, list):
+                    value = ','.join(str(bit) for bit in value)
+                row.append(value)
+            writer.writerow(row)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+How long a profile runs, without running it
+
+Jumps: at the end of a step with a jump count, the profile jumps back to the
+jump step that many times, then carries on with the next step; the count is
+reset for the next time the step is reached. A loop body therefore runs
+jump count + 1 times, and the time of a body is worked out once and
+multiplied, so nested loops of 999 cost the same as loops of 1.
+Crossing or forward jumps fall back to walking the profile step by step.
+
+Guaranteed soak and "wait for" steps can only take longer than their step
+time; assumed extra seconds per pass can be given, otherwise the estimate
+is the minimum.
+
+    estimate = profile_runtime.estimate_runtime(profile)
+    estimate.total                  # seconds
+    estimate.offsets[2]             # step 3 first starts this many seconds in
+    estimate.finish(time.time())    # epoch seconds
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import array
+
+import profile_validator
+
+# step walk limit for profiles that can't be solved loop by loop
+MAX_WALK_STEPS = 10 ** 7
+
+
+class RuntimeEstimate(object):
+    """Total runtime plus per step start offsets and pass counts"""
+    __slots__ = ('total', 'offsets', 'runs', 'open_ended')
+
+    def __init__(self, total, offsets, runs, open_ended):
+        """
+        :param total: seconds from start to the end of the last step
+        :param offsets: array('d'), seconds until each step first starts, step 1 at index 0
+        :param runs: array('l'), number of times each step runs
+        :param open_ended: True when soaks or waits can make the profile run longer
+        """
+        self.total = total
+        self.offsets = offsets
+        self.runs = runs
+        self.open_ended = open_ended
+
+    def finish(self, start_time):
+        """Earliest finish for a profile started at start_time (epoch seconds)"""
+        return start_time + self.total
+
+    def rows(self):
+        """(step number, first start offset, runs) per step"""
+        return [
+            (number, offset, runs)
+            for number, (offset, runs) in enumerate(zip(self.offsets, self.runs), 1)
+        ]
+
+    def __repr__(self):
+        return "RuntimeEstimate({:.0f}s, {} steps{})".format(
+            self.total, len(self.offsets), ", open ended" if self.open_ended else ""
+        )
+
+
+def _step_tables(profile, wait_time, soak_time):
+    """Per step seconds, jump target and count, 1 based (index 0 unused)"""
+    durations = [0.0]
+    targets = [0]
+    counts = [0]
+    open_ended = False
+    for step in profile.steps:
+        seconds = float(step.duration)
+        waits = (
+            step.wait_for_loop_events or step.wait_for_monitor_events or
+            step.guaranteed & profile_validator.DIGITAL_INPUT_WAIT_BITS
+        )
+        soaks = step.guaranteed & profile_validator.GUARANTEED_SOAK_BITS
+        if waits:
+            seconds += wait_time
+        if soaks:
+            seconds += soak_time
+        open_ended = open_ended or bool(waits or soaks)
+        durations.append(seconds)
+        targets.append(step.jump_step_number)
+        counts.append(step.jump_count if step.jump_count > 0 else 0)
+    return durations, targets, counts, open_ended
+
+
+def _is_nested(targets, counts):
+    """True when every jump goes back to a step and the loops nest"""
+    loops = []
+    for step in range(1, len(targets)):
+        if not counts[step]:
+            continue
+        if not 1 <= targets[step] <= step:
+            return False
+        loops.append((targets[step], step))
+    for first, last in loops:
+        for other_first, other_last in loops:
+            # partial overlap: one loop starts inside the other and ends outside
+            if first < other_first <= last < other_last:
+                return False
+    return True
+
+
+def _solve_nested(durations, targets, counts):
+    """Loop by loop: each body's time is computed once and multiplied"""
+    steps = len(durations) - 1
+    body_times = {}
+
+    def body(first, last):
+        """Seconds to run first..last once, not taking the jump on last"""
+        key = (first, last)
+        if key not in body_times:
+            total = 0.0
+            for step in range(first, last + 1):
+                total += durations[step]
+                if step != last and counts[step] and targets[step] >= first:
+                    total += counts[step] * body(targets[step], step)
+            body_times[key] = total
+        return body_times[key]
+
+    offsets = array.array('d')
+    runs = array.array('l', [1] * steps)
+    elapsed = 0.0
+    for step in range(1, steps + 1):
+        offsets.append(elapsed)
+        elapsed += durations[step]
+        if counts[step]:
+            elapsed += counts[step] * body(targets[step], step)
+            for inner in range(targets[step], step + 1):
+                runs[inner - 1] *= counts[step] + 1
+    return elapsed, offsets, runs
+
+
+def _walk(durations, targets, counts):
+    """Step by step, for jumps that don't nest"""
+    steps = len(durations) - 1
+    offsets = array.array('d', [-1.0] * steps)
+    runs = array.array('l', [0] * steps)
+    remaining = list(counts)
+    elapsed = 0.0
+    step = 1
+    walked = 0
+    while 1 <= step <= steps:
+        walked += 1
+        if walked > MAX_WALK_STEPS:
+            raise ValueError("profile runs more than {} steps".format(MAX_WALK_STEPS))
+        if offsets[step - 1] < 0:
+            offsets[step - 1] = elapsed
+        runs[step - 1] += 1
+        elapsed += durations[step]
+        if counts[step] and remaining[step]:
+            remaining[step] -= 1
+            step = targets[step]
+        else:
+            remaining[step] = counts[step]
+            step += 1
+    # steps jumped over never start
+    for index, offset in enumerate(offsets):
+        if offset < 0:
+            offsets[index] = float('nan')
+    return elapsed, offsets, runs
+
+
+def estimate_runtime(profile, wait_time=0.0, soak_time=0.0):
+    """
+    :param profile: chamber_profile.Profile
+    :param wait_time: assumed extra seconds each time a "wait for" step runs
+    :param soak_time: assumed extra seconds each time a guaranteed soak step runs
+    :return: RuntimeEstimate
+    """
+    durations, targets, counts, open_ended = _step_tables(profile, wait_time, soak_time)
+    if _is_nested(targets, counts):
+        total, offsets, runs = _solve_nested(durations, targets, counts)
+    else:
+        total, offsets, runs = _walk(durations, targets, counts)
+    return RuntimeEstimate(total, offsets, runs, open_ended)
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Check a profile in memory before it is uploaded
+
+Catches what the chamber would otherwise reject, or run wrong, only after
+the slow upload: ranges from the manual's profile register table, jump
+targets past the last step, more than one "wait for" on a step, setpoints
+outside the loop setpoint limits (on the loops a step uses) and waits on
+absent loops or inputs.
+
+The loop and monitor input registers (60-175) come from one span read and
+are cached on the Chamber, see Chamber.profile_limits.
+
+    problems = profile_validator.validate_profile(profile, chamber.profile_limits())
+    for problem in problems:
+        log.error(problem)
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import time
+
+import chamber_profile
+import chamber_state
+
+# Loop 1 setpoint through the last monitor input alarm hysteresis
+LIMITS_START = chamber_state.LOOP_START
+LIMITS_QUANTITY = (
+    chamber_state.MONITOR_INPUT_START +
+    chamber_state.MONITOR_INPUT_STRIDE * chamber_state.MONITOR_INPUT_COUNT -
+    LIMITS_START
+)
+
+# step guaranteed soak / wait for register: bits 0-4 soak loops 1-5,
+# bits 5-12 wait for digital inputs 1-8
+GUARANTEED_SOAK_BITS = 0x001F
+DIGITAL_INPUT_WAIT_BITS = 0x1FE0
+
+
+def step_uses_loop(step, loop):
+    """True when a step has a target setpoint, guaranteed soak or wait for on loop
+    A 0 target with neither means the loop isn't part of the step.
+    """
+    bit = 1 << (loop - 1)
+    return bool(
+        getattr(step, 'target_setpoint_for_loop_{}'.format(loop)) or
+        step.guaranteed & GUARANTEED_SOAK_BITS & bit or
+        step.wait_for_loop_events & bit
+    )
+
+
+def _bit_numbers(mask):
+    """1 based numbers of the bits set in mask"""
+    return [bit + 1 for bit in range(16) if mask & (1 << bit)]
+
+
+class ProfileLimits(object):
+    """Loop setpoint limits and which loops / monitor inputs are fitted"""
+    __slots__ = ('upper', 'lower', 'loops', 'monitor_inputs', 'timestamp')
+
+    def __init__(self, upper, lower, loops, monitor_inputs, timestamp=None):
+        """
+        :param upper: tuple of upper setpoint limit per loop, raw tenths
+        :param lower: tuple of lower setpoint limit per loop, raw tenths
+        :param loops: frozenset of fitted loop numbers 1-5
+        :param monitor_inputs: frozenset of fitted monitor input numbers 1-8
+        """
+        self.upper = upper
+        self.lower = lower
+        self.loops = loops
+        self.monitor_inputs = monitor_inputs
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    @classmethod
+    def from_registers(cls, raw, timestamp=None):
+        """Limits from registers LIMITS_START onward (LIMITS_QUANTITY of them)
+        A loop or input is taken as absent when every one of its registers is 0,
+        which is how the EZT reports options the chamber doesn't have.
+        """
+        loops = chamber_state.loop_views(raw, range(1, chamber_state.LOOP_COUNT + 1))
+        inputs_index = chamber_state.MONITOR_INPUT_START - LIMITS_START
+        monitor_inputs = []
+        for number in range(1, chamber_state.MONITOR_INPUT_COUNT + 1):
+            index = inputs_index + chamber_state.MONITOR_INPUT_STRIDE * (number - 1)
+            if any(raw[index:index + chamber_state.MONITOR_INPUT_STRIDE]):
+                monitor_inputs.append(number)
+        return cls(
+            tuple(loop.code(4) for loop in loops),
+            tuple(loop.code(5) for loop in loops),
+            frozenset(loop.number for loop in loops if any(loop.codes())),
+            frozenset(monitor_inputs),
+            timestamp
+        )
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+
+class ProfileProblem(object):
+    """One thing wrong with a profile"""
+    __slots__ = ('step', 'field', 'message')
+
+    def __init__(self, step, field, message):
+        """
+        :param step: step number, 0 for the header
+        :param field: HeaderView / StepView field name
+        """
+        self.step = step
+        self.field = field
+        self.message = message
+
+    def __str__(self):
+        where = "header" if not self.step else "step {}".format(self.step)
+        return "{} {}: {}".format(where, self.field, self.message)
+
+    __repr__ = __str__
+
+
+class ProfileValidationError(ValueError):
+    """Raised instead of uploading a profile with problems"""
+
+    def __init__(self, problems, name=None):
+        super(ProfileValidationError, self).__init__(problems, name)
+        self.problems = problems
+        self.name = name
+
+    def __str__(self):
+        return "{}{} problem(s): {}".format(
+            "{}: ".format(self.name) if self.name else "",
+            len(self.problems),
+            "; ".join(str(problem) for problem in self.problems)
+        )
+
+
+def _check_range(problems, step, field, value, low, high):
+    if not low <= value <= high:
+        problems.append(ProfileProblem(
+            step, field, "{} outside {} - {}".format(value, low, high)
+        ))
+
+
+def _check_setpoint(problems, step, field, value, loop, limits):
+    if limits is None or loop not in limits.loops:
+        return
+    lower, upper = limits.lower[loop - 1], limits.upper[loop - 1]
+    if not lower <= value <= upper:
+        problems.append(ProfileProblem(
+            step, field, "{:.1f} outside loop {} setpoint limits {:.1f} - {:.1f}".format(
+                value / 10.0, loop, lower / 10.0, upper / 10.0
+            )
+        ))
+
+
+def validate_profile(profile, limits=None):
+    """Every problem found in a profile, nothing is sent to the chamber
+    :param profile: chamber_profile.Profile
+    :param limits: ProfileLimits, None checks only what needs no chamber
+    :return: list of ProfileProblem, empty when the profile looks good
+    """
+    problems = []
+    header = profile.header
+    steps_total = header.total_number_of_steps_in_profile
+
+    _check_range(problems, 0, 'autostart', header.autostart, 0, 2)
+    _check_range(
+        problems, 0, 'total_number_of_steps_in_profile',
+        steps_total, 1, chamber_profile.MAX_STEPS
+    )
+    if steps_total != len(profile):
+        problems.append(ProfileProblem(
+            0, 'total_number_of_steps_in_profile',
+            "says {} steps, profile has {}".format(steps_total, len(profile))
+        ))
+    for offset, value in enumerate(header.values()[4:9]):
+        for char in (value & 0xFF, (value >> 8) & 0xFF):
+            if not 32 <= char <= 126:
+                problems.append(ProfileProblem(
+                    0, chamber_profile.HeaderView.fields[4 + offset],
+                    "character {} is not printable ascii".format(char)
+                ))
+
+    for step in profile.steps:
+        number = step.number
+        _check_range(problems, number, 'time_hours', step.time_hours, 0, 999)
+        mm_ss = step.time_mm_ss & 0xFFFF
+        _check_range(problems, number, 'time_mm_ss minutes', mm_ss >> 8, 0, 59)
+        _check_range(problems, number, 'time_mm_ss seconds', mm_ss & 0xFF, 0, 59)
+        _check_range(problems, number, 'jump_count', step.jump_count, 0, 999)
+        if step.jump_count and not 1 <= step.jump_step_number <= len(profile):
+            problems.append(ProfileProblem(
+                number, 'jump_step_number',
+                "jumps to step {}, profile has {} steps".format(
+                    step.jump_step_number, len(profile)
+                )
+            ))
+
+        # Only one "wait for" per step
+        soak = step.guaranteed & GUARANTEED_SOAK_BITS
+        digital_inputs = _bit_numbers(step.guaranteed & DIGITAL_INPUT_WAIT_BITS)
+        wait_loops = _bit_numbers(step.wait_for_loop_events)
+        wait_inputs = _bit_numbers(step.wait_for_monitor_events)
+        if step.guaranteed & ~(GUARANTEED_SOAK_BITS | DIGITAL_INPUT_WAIT_BITS):
+            problems.append(ProfileProblem(number, 'guaranteed', "undefined bits set"))
+        if len(digital_inputs) + len(wait_loops) + len(wait_inputs) > 1:
+            problems.append(ProfileProblem(
+                number, 'wait_for', "more than one wait for on the step"
+            ))
+        if any(loop > chamber_state.LOOP_COUNT for loop in wait_loops):
+            problems.append(ProfileProblem(
+                number, 'wait_for_loop_events', "undefined bits set"
+            ))
+        if any(i > chamber_state.MONITOR_INPUT_COUNT for i in wait_inputs):
+            problems.append(ProfileProblem(
+                number, 'wait_for_monitor_events', "undefined bits set"
+            ))
+
+        if limits is not None:
+            for loop in _bit_numbers(soak):
+                if loop not in limits.loops:
+                    problems.append(ProfileProblem(
+                        number, 'guaranteed', "guaranteed soak on absent loop {}".format(loop)
+                    ))
+            for loop in wait_loops:
+                if loop <= chamber_state.LOOP_COUNT and loop not in limits.loops:
+                    problems.append(ProfileProblem(
+                        number, 'wait_for_loop_events', "waits for absent loop {}".format(loop)
+                    ))
+            for monitor_input in wait_inputs:
+                if monitor_input <= chamber_state.MONITOR_INPUT_COUNT and \
+                        monitor_input not in limits.monitor_inputs:
+                    problems.append(ProfileProblem(
+                        number, 'wait_for_monitor_events',
+                        "waits for absent monitor input {}".format(monitor_input)
+                    ))
+            if len(wait_loops) == 1:
+                _check_setpoint(
+                    problems, number, 'wait_for_setpoint',
+                    step.wait_for_setpoint, wait_loops[0], limits
+                )
+
+        for loop in range(1, chamber_state.LOOP_COUNT + 1):
+            if not step_uses_loop(step, loop):
+                continue
+            field = 'target_setpoint_for_loop_{}'.format(loop)
+            _check_setpoint(problems, number, field, getattr(step, field), loop, limits)
+
+    return problems
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Read cache for chamber registers, with a TTL per register class
+
+Every register is live, setpoint, slow or static (see
+chamber_commands.ctrl_register_classes). Live registers default to a TTL of 0
+and are always read from the chamber. Configuration registers are served from
+the cache until their TTL runs out. The loop setpoints get a TTL of their own,
+short because a running profile ramps them.
+
+The cache is also write-through: Chamber.set_register stores what it wrote,
+so later reads see it. Skipping writes that would not change the value is
+opt in (a deadband, see RegisterCache): setpoint, slow and static registers
+are skipped, and only while the value we last read or wrote is within its TTL.
+Live registers, which include the write only command registers such as
+ALARM_ACKNOWLEDGE and PROFILE_ADVANCE_STEP, are always written.
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import threading
+import time
+
+import chamber_commands
+
+# register class => seconds a cached value stays fresh
+DEFAULT_TTLS = {
+    'live': 0.0,
+    'setpoint': 1.0,
+    'slow': 5.0,
+    'static': 600.0,
+}
+
+
+def to_int16(raw):
+    """Registers hold signed 16 bit values, setters may hand back 0-65535"""
+    raw = int(raw) & 0xFFFF
+    return raw - 0x10000 if raw & 0x8000 else raw
+
+
+class RegisterRead(object):
+    """One register value and where it came from"""
+    __slots__ = ('reg', 'raw', 'timestamp', 'cached')
+
+    def __init__(self, reg, raw, timestamp, cached):
+        """
+        :param reg: register number
+        :param raw: int16 register value
+        :param timestamp: time.time() the value was read from the chamber
+        :param cached: True when served from the cache, False when fresh off the bus
+        """
+        self.reg = reg
+        self.raw = raw
+        self.timestamp = timestamp
+        self.cached = cached
+
+    @property
+    def name(self):
+        return chamber_commands.reg_value_to_name(self.reg)
+
+    @property
+    def age(self):
+        return time.time() - self.timestamp
+
+    @property
+    def value(self):
+        """Human readable, same as Chamber.get_register"""
+        return chamber_commands.cached_decode_read_value(self.reg, self.raw)
+
+    def __repr__(self):
+        return "RegisterRead({}, {}, {})".format(
+            self.name or self.reg, self.raw, 'cached' if self.cached else 'fresh'
+        )
+
+
+class RegisterCache(object):
+    """Last known raw value per register, expired by register class TTL"""
+
+    def __init__(self, ttls=None, deadband=None):
+        """
+        :param ttls: dict of register class => seconds, overrides DEFAULT_TTLS
+        :param deadband: None never skips a write (the default), 0.0 skips exact
+            repeats, more also skips analog writes this close (engineering units)
+            to the confirmed value
+        """
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self.deadband = deadband
+        self.hits = 0
+        self.misses = 0
+        self.suppressed = 0
+        self._lock = threading.Lock()
+        # register => (raw, timestamp)
+        self._entries = {}
+
+    def ttl(self, reg):
+        if 0 <= reg < chamber_commands.ctrl_register_count:
+            return self.ttls[chamber_commands.ctrl_register_classes[reg]]
+        return self.ttls['live']
+
+    def lookup(self, reg, now=None):
+        """
+        :return: RegisterRead with cached=True, None when missing or expired
+        """
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self._entries.get(reg)
+            if entry is None or now - entry[1] >= self.ttl(reg):
+                self.misses += 1
+                return None
+            self.hits += 1
+        return RegisterRead(reg, entry[0], entry[1], True)
+
+    def last(self, reg):
+        """Last confirmed raw value whatever its age, None when unknown"""
+        with self._lock:
+            entry = self._entries.get(reg)
+        return None if entry is None else entry[0]
+
+    def store(self, reg, raw, timestamp=None):
+        """Remember a value read from, or confirmed written to, the chamber"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            self._entries[reg] = (to_int16(raw), timestamp)
+
+    def store_block(self, start_reg, values, timestamp=None):
+        """Remember a block read, e.g. a Snapshot or read_loops"""
+        timestamp = timestamp if timestamp is not None else time.time()
+        with self._lock:
+            for reg, raw in enumerate(values, start_reg):
+                self._entries[reg] = (to_int16(raw), timestamp)
+
+    def is_redundant(self, reg, raw, now=None):
+        """True when writing raw would not change the value the chamber holds
+        Always False unless a deadband was given, for live registers (status,
+        commands, write only registers) and for registers outside the map.
+        Otherwise the value we last read or wrote must still be within its TTL.
+        """
+        if self.deadband is None or not 0 <= reg < chamber_commands.ctrl_register_count:
+            return False
+        if chamber_commands.ctrl_register_classes[reg] == 'live':
+            return False
+        now = now if now is not None else time.time()
+        with self._lock:
+            entry = self._entries.get(reg)
+        if entry is None or now - entry[1] >= self.ttl(reg):
+            return False
+        difference = abs(to_int16(raw) - entry[0])
+        if difference == 0:
+            redundant = True
+        else:
+            divisor = chamber_commands.ctrl_register_divisors[reg]
+            # NaN divisor: not analog, no deadband
+            redundant = divisor == divisor and difference / divisor <= self.deadband
+        if redundant:
+            with self._lock:
+                self.suppressed += 1
+        return redundant
+
+    def invalidate(self, regs=None):
+        """Forget some registers, or everything when regs is None"""
+        with self._lock:
+            if regs is None:
+                self._entries.clear()
+                return
+            for reg in regs:
+                self._entries.pop(reg, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'suppressed': self.suppressed,
+                'size': len(self._entries)
+            }
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Live register image shared between local processes
+
+One process owns the chamber connection and publishes every poll into a
+memory mapped file laid out by register number. Any number of readers
+(logger, dashboard, operator scripts) map the same file and read it with
+no bus traffic and no locks.
+
+A sequence counter guards the data (a seqlock): the publisher makes it odd
+before writing and even after, readers retry until they see the same even
+value before and after their copy.
+
+    # owner of the connection
+    publisher = register_image.ImagePublisher(chamber)
+    publisher.start(interval=1.0)
+
+    # any other process
+    image = register_image.RegisterImage.open()
+    snap = image.snapshot()         # chamber_state.Snapshot, no bus read
+    snap.loop[0].process_value
+
+By John Stile At Meyer Sound Laboratories Inc.
+this is distributed under a MIT license, see LICENSE
+"""
+
+import array
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+import chamber_state
+
+MAGIC = 'EZT1'
+# magic, sequence, timestamp of the last publish, start register, quantity
+HEADER = struct.Struct('=4sIdHH')
+HEADER_SIZE = 32
+SEQUENCE_OFFSET = 4
+SEQUENCE = struct.Struct('=I')
+TIMESTAMP_OFFSET = 8
+TIMESTAMP = struct.Struct('=d')
+
+
+def default_path(chamber_number=1):
+    """/dev/shm keeps the image in memory, fall back to the temp dir"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(directory, 'ezt570i_{}.img'.format(chamber_number))
+
+
+class RegisterImage(object):
+    """int16 per register, registers start_reg onward, behind a seqlock"""
+
+    def __init__(self, path, start_reg, quantity, writable, mapping):
+        self.path = path
+        self.start_reg = start_reg
+        self.quantity = quantity
+        self.writable = writable
+        self._map = mapping
+
+    @classmethod
+    def create(cls, path=None, start_reg=chamber_state.CONTROL_AREA_START,
+               quantity=chamber_state.CONTROL_AREA_QUANTITY):
+        """Create (or take over) the image, for the publishing process
+        A new file is built next to path and renamed over it, readers still
+        mapping an older image keep their file and never see it truncated.
+        """
+        path = path or default_path()
+        size = HEADER_SIZE + 2 * quantity
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+        try:
+            os.fchmod(fd, 0o644)
+            os.ftruncate(fd, size)
+            mapping = mmap.mmap(fd, size)
+            mapping[:HEADER.size] = HEADER.pack(MAGIC, 0, 0.0, start_reg, quantity)
+            os.rename(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        finally:
+            os.close(fd)
+        return cls(path, start_reg, quantity, True, mapping)
+
+    @classmethod
+    def open(cls, path=None):
+        """Map an existing image read only, for reader processes"""
+        path = path or default_path()
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, sequence, timestamp, start_reg, quantity = \
+            HEADER.unpack(mapping[:HEADER.size])
+        if magic != MAGIC:
+            raise ValueError("{} is not a register image".format(path))
+        return cls(path, start_reg, quantity, False, mapping)
+
+    def close(self):
+        self._map.close()
+
+    @property
+    def sequence(self):
+        """Even when stable, odd while a publish is in progress"""
+        return SEQUENCE.unpack_from(self._map, SEQUENCE_OFFSET)[0]
+
+    def publish(self, start_reg, values, timestamp=None):
+        """Copy a block of registers into the image
+        :param values: array('h') as returned by read_register_span
+        """
+        assert self.writable, "image opened read only"
+        offset = start_reg - self.start_reg
+        if offset < 0 or offset + len(values) > self.quantity:
+            raise IndexError("registers {}-{} not in image".format(
+                start_reg, start_reg + len(values) - 1
+            ))
+        if not isinstance(values, array.array) or values.typecode != 'h':
+            values = array.array('h', values)
+        timestamp = timestamp if timestamp is not None else time.time()
+        start = HEADER_SIZE + 2 * offset
+        sequence = self.sequence
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, (sequence + 1) & 0xFFFFFFFF)
+        self._map[start:start + 2 * len(values)] = values.tostring()
+        TIMESTAMP.pack_into(self._map, TIMESTAMP_OFFSET, timestamp)
+        SEQUENCE.pack_into(self._map, SEQUENCE_OFFSET, (sequence + 2) & 0xFFFFFFFF)
+
+    def read(self, start_reg=None, quantity=None, timeout=1.0):
+        """Consistent copy of a span of the image
+        :return: (array('h'), timestamp of the publish it came from)
+        """
+        start_reg = self.start_reg if start_reg is None else start_reg
+        quantity = self.quantity - (start_reg - self.start_reg) if quantity is None \
+            else quantity
+        offset = start_reg - self.start_reg
+        if offset < 0 or offset + quantity > self.quantity:
+            raise IndexError("registers {}-{} not in image".format(
+                start_reg, start_reg + quantity - 1
+            ))
+        start = HEADER_SIZE + 2 * offset
+        deadline = time.time() + timeout
+        while True:
+            before = self.sequence
+            if not before & 1:
+                data = self._map[start:start + 2 * quantity]
+                timestamp = TIMESTAMP.unpack_from(self._map, TIMESTAMP_OFFSET)[0]
+                if self.sequence == before:
+                    values = array.array('h')
+                    values.fromstring(data)
+                    return values, timestamp
+            if time.time() > deadline:
+                raise RuntimeError("register image {} stuck mid publish".format(self.path))
+
+    def snapshot(self):
+        """chamber_state.Snapshot of the whole image, same API as Chamber.snapshot"""
+        values, timestamp = self.read()
+        return chamber_state.Snapshot(values, timestamp, self.start_reg)
+
+    def buffer(self):
+        """Zero copy view of the register data, not guarded by the sequence
+        counter; check sequence before and after when consistency matters.
+        """
+        return buffer(self._map, HEADER_SIZE, 2 * self.quantity)
+
+
+class ImagePublisher(object):
+    """Poll the control area and publish it into a RegisterImage"""
+
+    def __init__(self, chamber, image=None, log=None):
+        """
+        :param chamber: chamber_control.Chamber, shared through ChamberCommunication.bus_lock
+        :param image: RegisterImage.create(), default at default_path()
+        :param log: logger, default chamber.log
+        """
+        self.chamber = chamber
+        self.image = image if image is not None else RegisterImage.create(
+            default_path(chamber.ccomm.chamber_number)
+        )
+        self.log = log if log is not None else chamber.log
+        self._callbacks = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback):
+        """callback(snapshot) after every publish, e.g. AlarmWatcher feeding"""
+        self._callbacks.append(callback)
+
+    def poll(self):
+        """Read the control area once and publish it
+        The reads hold the connection's bus_lock, so the main thread can keep
+        using the same Chamber and the snapshot is one consistent sweep.
+        :return: chamber_state.Snapshot
+        """
+        with self.chamber.ccomm.bus_lock:
+            snap = self.chamber.snapshot()
+        self.image.publish(snap.start_reg, snap.raw, snap.timestamp)
+        for callback in list(self._callbacks):
+            callback(snap)
+        return snap
+
+    def start(self, interval=1.0):
+        """Publish from a background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                self.log.error("Register image publish failed:{}".format(e))
+            self._stop.wait(interval)